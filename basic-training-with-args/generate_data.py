@@ -1,22 +1,70 @@
 import pandas as pd
+import numpy as np
+import urllib.request
 import argparse
+import hashlib
+import os
 
-def preprocess_titanic_data():
-    # Load the Titanic dataset from a URL
-    url = 'https://raw.githubusercontent.com/datasciencedojo/datasets/master/titanic.csv'
-    data = pd.read_csv(url)
+TITANIC_URL = 'https://raw.githubusercontent.com/datasciencedojo/datasets/master/titanic.csv'
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'docker-ml-learning')
+
+FEATURES = ['Pclass', 'Sex', 'Age', 'SibSp', 'Parch', 'Fare', 'Embarked']
+TARGET = 'Survived'
+
+SEX_MAPPING = {'male': 0, 'female': 1}
+EMBARKED_MAPPING = {'C': 0, 'Q': 1, 'S': 2}
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def fetch_cached(url, cache_dir=DEFAULT_CACHE_DIR, sha256=None):
+    """
+    Get a local copy of `url`, downloading it only if it is not in the cache yet.
+
+    Files are cached by URL and expected checksum, so once a file is cached runs need no network. With `sha256`
+    the cached file is verified, and re-downloaded if it does not match.
+    """
+    key = hashlib.sha256(f"{url}\0{sha256 or ''}".encode()).hexdigest()[:16]
+    path = os.path.join(cache_dir, f"{key}-{os.path.basename(url)}")
+
+    if os.path.exists(path) and (sha256 is None or file_sha256(path) == sha256):
+        print(f"Using cached {url} from {path}")
+        return path
+
+    os.makedirs(cache_dir, exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    print(f"Downloading {url} to {path}")
+    urllib.request.urlretrieve(url, temp_path)
+
+    if sha256 is not None and file_sha256(temp_path) != sha256:
+        os.remove(temp_path)
+        raise ValueError(f"Checksum mismatch for {url}, expected {sha256}")
+
+    os.replace(temp_path, path)
+    return path
+
+
+def preprocess_titanic_data(data_path=None):
+    # Load the Titanic dataset, downloaded once into the local cache
+    data = pd.read_csv(data_path or fetch_cached(TITANIC_URL))
 
     # Select relevant features and target
-    features = ['Pclass', 'Sex', 'Age', 'SibSp', 'Parch', 'Fare', 'Embarked']
-    target = 'Survived'
+    features = FEATURES
+    target = TARGET
 
     # Handle missing values
     data = data.assign(Age=data['Age'].fillna(data['Age'].median()))
     data = data.assign(Embarked=data['Embarked'].fillna(data['Embarked'].mode()[0]))
 
     # Convert categorical features to numerical
-    data['Sex'] = data['Sex'].map({'male': 0, 'female': 1})
-    data['Embarked'] = data['Embarked'].map({'C': 0, 'Q': 1, 'S': 2})
+    data['Sex'] = data['Sex'].map(SEX_MAPPING)
+    data['Embarked'] = data['Embarked'].map(EMBARKED_MAPPING)
 
     # Select features and target
     X = data[features]
@@ -27,9 +75,120 @@ def preprocess_titanic_data():
 
     return processed_data
 
+
+def median_from_counts(counts):
+    """
+    Get the median of the values counted in `counts` (value -> count), averaging the two middle values for an
+    even count like pandas does.
+    """
+    values = np.array(sorted(counts))
+    cumulative = np.cumsum([counts[value] for value in values])
+    total = cumulative[-1]
+
+    lower = values[np.searchsorted(cumulative, (total - 1) // 2, side='right')]
+    upper = values[np.searchsorted(cumulative, total // 2, side='right')]
+    return (lower + upper) / 2
+
+
+def compute_fill_statistics(data_path, chunk_size, approximate=False, bin_width=0.01):
+    """
+    Compute the Age median and Embarked mode in one chunked pass over the raw CSV, in memory bounded by the
+    number of distinct values instead of the number of rows.
+
+    With `approximate`, ages are counted in histogram bins of `bin_width` years instead of by exact value, which
+    bounds the memory for continuous ages at the cost of a median that may be off by up to one bin.
+    """
+    age_counts = {}
+    embarked_counts = {}
+
+    for chunk in pd.read_csv(data_path, usecols=['Age', 'Embarked'], chunksize=chunk_size):
+        ages = chunk['Age'].dropna()
+        if approximate:
+            ages = np.floor(ages / bin_width)
+        for value, count in ages.value_counts().items():
+            age_counts[value] = age_counts.get(value, 0) + count
+        for value, count in chunk['Embarked'].dropna().value_counts().items():
+            embarked_counts[value] = embarked_counts.get(value, 0) + count
+
+    age_median = median_from_counts(age_counts)
+    if approximate:
+        # Report the middle of the median bin
+        age_median = (age_median + 0.5) * bin_width
+
+    # Ties are resolved to the smallest value, like Series.mode()[0]
+    max_count = max(embarked_counts.values())
+    embarked_mode = min(value for value, count in embarked_counts.items() if count == max_count)
+
+    return age_median, embarked_mode
+
+
+def preprocess_titanic_data_streaming(data_path, output_path, chunk_size=1000000, approximate=False):
+    """
+    Preprocess a Titanic CSV that may not fit in memory.
+
+    A first chunked pass computes the fill statistics, a second pass fills, maps and appends the rows chunk by
+    chunk to the output file.
+    """
+    age_median, embarked_mode = compute_fill_statistics(data_path, chunk_size, approximate)
+    print(f"Filling missing Age with {age_median} and Embarked with {embarked_mode}")
+
+    rows = 0
+    for index, chunk in enumerate(pd.read_csv(data_path, usecols=FEATURES + [TARGET], chunksize=chunk_size)):
+        chunk = chunk.assign(Age=chunk['Age'].fillna(age_median))
+        chunk = chunk.assign(Embarked=chunk['Embarked'].fillna(embarked_mode))
+        chunk['Sex'] = chunk['Sex'].map(SEX_MAPPING)
+        chunk['Embarked'] = chunk['Embarked'].map(EMBARKED_MAPPING)
+
+        chunk[FEATURES + [TARGET]].to_csv(output_path, mode='w' if index == 0 else 'a', header=index == 0, index=False)
+        rows += len(chunk)
+
+    return rows
+
+
+def generate_synthetic_titanic(output_path, rows, chunk_size=1000000, seed=42):
+    """
+    Write a raw Titanic-like CSV with `rows` rows, chunk by chunk, to test preprocessing at scale.
+    """
+    rng = np.random.default_rng(seed)
+    for start in range(0, rows, chunk_size):
+        size = min(chunk_size, rows - start)
+        ages = np.round(rng.gamma(5.0, 6.0, size), 1)
+        ages[rng.random(size) < 0.2] = np.nan
+        embarked = rng.choice(np.array(['S', 'C', 'Q'], dtype=object), size, p=[0.72, 0.19, 0.09])
+        embarked[rng.random(size) < 0.002] = np.nan
+
+        chunk = pd.DataFrame({
+            'PassengerId': np.arange(start + 1, start + size + 1),
+            'Survived': rng.integers(0, 2, size),
+            'Pclass': rng.choice([1, 2, 3], size, p=[0.24, 0.21, 0.55]),
+            'Sex': rng.choice(np.array(['male', 'female'], dtype=object), size, p=[0.65, 0.35]),
+            'Age': ages,
+            'SibSp': rng.poisson(0.5, size),
+            'Parch': rng.poisson(0.4, size),
+            'Fare': np.round(rng.lognormal(2.7, 1.0, size), 4),
+            'Embarked': embarked,
+        })
+        chunk.to_csv(output_path, mode='w' if start == 0 else 'a', header=start == 0, index=False)
+
+    print(f"Synthetic dataset with {rows} rows saved to {output_path}")
+
+
 def main(args):
+    if args.synthetic_rows:
+        data_path = args.input_path or os.path.join(args.cache_dir, f"titanic_synthetic_{args.synthetic_rows}.csv")
+        if not os.path.exists(data_path):
+            os.makedirs(os.path.dirname(os.path.abspath(data_path)), exist_ok=True)
+            generate_synthetic_titanic(data_path, args.synthetic_rows, args.chunk_size)
+    else:
+        data_path = args.input_path or fetch_cached(args.url, args.cache_dir, args.sha256)
+
+    if args.streaming:
+        rows = preprocess_titanic_data_streaming(data_path, args.output_path, args.chunk_size, args.approximate)
+        print(f"{rows} rows saved to {args.output_path}")
+        return
+
     # Preprocess the Titanic dataset
-    data = preprocess_titanic_data()
+    data = preprocess_titanic_data(data_path)
 
     # Save the preprocessed dataset to a CSV file
     data.to_csv(args.output_path, index=False)
@@ -38,6 +197,14 @@ def main(args):
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Generate and preprocess the Titanic dataset.')
     parser.add_argument('--output_path', type=str, default='titanic_processed.csv', help='Output file path.')
+    parser.add_argument('--input_path', type=str, default=None, help='Raw CSV to preprocess instead of downloading the dataset.')
+    parser.add_argument('--url', type=str, default=TITANIC_URL, help='URL of the raw dataset.')
+    parser.add_argument('--sha256', type=str, default=None, help='Expected SHA-256 of the downloaded dataset.')
+    parser.add_argument('--cache_dir', type=str, default=DEFAULT_CACHE_DIR, help='Directory for downloaded and synthetic datasets.')
+    parser.add_argument('--streaming', action='store_true', help='Preprocess in chunks, for datasets larger than memory.')
+    parser.add_argument('--chunk_size', type=int, default=1000000, help='Rows per chunk in streaming mode.')
+    parser.add_argument('--approximate', action='store_true', help='Use a histogram sketch for the Age median in streaming mode.')
+    parser.add_argument('--synthetic_rows', type=int, default=None, help='Preprocess a synthetic dataset with this many rows.')
 
     args = parser.parse_args()
-    main(args)
\ No newline at end of file
+    main(args)
@@ -0,0 +1,76 @@
+"""
+Compare the latency and throughput of a compiled forest (src/forest_compiler.py) against sklearn's
+RandomForestClassifier.predict_proba, and check that both give bit-identical probabilities.
+
+The compiled forest is built for low-latency scoring of small batches, where sklearn's per-tree Python and
+threading overhead dominates. For large batches sklearn's Cython traversal of one tree at a time has the
+higher throughput, the table shows where the two cross over. On the Titanic data with 200 trees that is at
+~400 rows, serve.py scores larger batches with the sklearn model (COMPILED_MAX_BATCH_SIZE).
+
+Usage:
+    python benchmarks/bench_forest_compiler.py --n_estimators 200 --batch_sizes 1,100,10000
+"""
+from sklearn.ensemble import RandomForestClassifier
+import pandas as pd
+import numpy as np
+import argparse
+import time
+import sys
+import os
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC_DIR)
+
+from forest_compiler import compile_forest
+
+
+def time_call(function, X, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function(X)
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+
+def main(args):
+    data = pd.read_csv(args.data_path)
+    X = data.iloc[:, :-1].values
+    y = data.iloc[:, -1].values
+
+    clf = RandomForestClassifier(n_estimators=args.n_estimators, max_depth=args.max_depth, random_state=args.random_state)
+    clf.fit(X, y)
+    compiled_forest = compile_forest(clf)
+    print(f"Forest: {args.n_estimators} trees, {len(compiled_forest.feature)} nodes, max depth {compiled_forest.max_depth}")
+
+    # Score perturbed copies of the rows, so batches larger than the dataset still take varied paths
+    rng = np.random.RandomState(args.random_state)
+    max_batch_size = max(args.batch_sizes)
+    rows = X[rng.randint(0, len(X), max_batch_size)] + rng.normal(0, 0.5, (max_batch_size, X.shape[1]))
+
+    if not np.array_equal(clf.predict_proba(rows), compiled_forest.predict_proba(rows)):
+        raise ValueError("Compiled forest probabilities differ from sklearn")
+    print(f"Probabilities of {max_batch_size} rows are bit-identical\n")
+
+    print(f"{'batch size':>10} {'sklearn ms':>12} {'compiled ms':>12} {'sklearn rows/s':>15} {'compiled rows/s':>16} {'speedup':>8}")
+    for batch_size in args.batch_sizes:
+        batch = rows[:batch_size]
+        sklearn_time = time_call(clf.predict_proba, batch, args.repeats)
+        compiled_time = time_call(compiled_forest.predict_proba, batch, args.repeats)
+        print(
+            f"{batch_size:>10} {sklearn_time * 1e3:>12.3f} {compiled_time * 1e3:>12.3f} "
+            f"{batch_size / sklearn_time:>15.0f} {batch_size / compiled_time:>16.0f} {sklearn_time / compiled_time:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the compiled forest against sklearn.')
+    parser.add_argument('--data_path', type=str, default=os.path.join(SRC_DIR, "titanic_processed.csv"), help='Path to the dataset CSV file.')
+    parser.add_argument('--n_estimators', type=int, default=200, help='Number of trees.')
+    parser.add_argument('--max_depth', type=int, default=None, help='Maximum depth of the trees.')
+    parser.add_argument('--batch_sizes', type=lambda value: [int(size) for size in value.split(",")], default=[1, 10, 100, 1000, 10000], help='Comma-separated batch sizes.')
+    parser.add_argument('--repeats', type=int, default=20, help='Timed calls per batch size, the median is reported.')
+    parser.add_argument('--random_state', type=int, default=42, help='Random seed.')
+
+    args = parser.parse_args()
+    main(args)
@@ -13,4 +13,6 @@ services:
       - /bin/bash
       - -c
       - {command}
-"""
\ No newline at end of file
+"""
+
+CONTAINER_POOL_LABEL = 'docker-ml-learning.container-pool'
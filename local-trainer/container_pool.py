@@ -0,0 +1,228 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+import atexit
+import hashlib
+import subprocess
+import threading
+import time
+
+import constants
+
+
+@dataclass
+class PooledContainer:
+    """
+    PooledContainer class to track a warm container owned by a ContainerPool.
+
+    Attributes:
+        container_id (str): The Docker container ID.
+        pool_key (str): The key of the pool the container belongs to (image, mounts and requirements hash).
+        created_at (float): Time the container was started.
+        last_used (float): Time the container was last released back to the pool.
+        jobs_run (int): Number of jobs executed in the container so far.
+    """
+    container_id: str
+    pool_key: str
+    created_at: float = field(default_factory=time.time)
+    last_used: float = field(default_factory=time.time)
+    jobs_run: int = 0
+
+
+def get_pool_key(image: str, volumes: List[str], requirements_path: Optional[str] = None) -> str:
+    """
+    Get the pool key for a set of container settings.
+
+    Containers can only be shared between jobs that use the same image, the same mounts (mounts
+    cannot be changed on a running container) and the same requirements file contents.
+    """
+    digest = hashlib.sha256()
+    digest.update(image.encode())
+    for volume in sorted(volumes):
+        digest.update(b"\0" + volume.encode())
+    if requirements_path:
+        with open(requirements_path, "rb") as f:
+            digest.update(b"\0" + f.read())
+    return digest.hexdigest()[:16]
+
+
+class ContainerPool:
+    def __init__(self, max_jobs_per_container: int = 20, idle_timeout: float = 600.0, max_containers: int = 4):
+        """ContainerPool class to keep pre-started, pre-provisioned containers around between training jobs.
+
+        Containers are started once per pool key with `docker run` and kept alive with a no-op command.
+        Jobs are executed inside them with `docker exec`, so back-to-back jobs skip container startup
+        and the requirements install. A daemon thread removes containers that stay idle for longer than
+        `idle_timeout`, also when no new jobs arrive.
+
+        Args:
+            max_jobs_per_container (int): Number of jobs after which a container is recycled. Defaults to 20.
+            idle_timeout (float): Seconds a container may sit idle before it is removed. Defaults to 600.
+            max_containers (int): Maximum number of idle containers kept warm across all pool keys. Defaults to 4.
+        """
+        self.max_jobs_per_container = max_jobs_per_container
+        self.idle_timeout = idle_timeout
+        self.max_containers = max_containers
+        self._idle: Dict[str, List[PooledContainer]] = {}
+        # Containers handed out by acquire and not yet released or discarded, removed too on shutdown
+        self._in_use: Dict[str, PooledContainer] = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._reaper = threading.Thread(target=self._reap_periodically, name="container-pool-reaper", daemon=True)
+        self._reaper.start()
+        atexit.register(self.shutdown)
+
+
+    def acquire(self, image: str, volumes: List[str], working_dir: str = "/opt/ml/code", requirements_file: Optional[str] = None, requirements_path: Optional[str] = None) -> PooledContainer:
+        """
+        Get a warm container for the given settings, starting and provisioning a new one if none is idle.
+
+        Args:
+            image (str): The URI of the Docker image.
+            volumes (List[str]): The volumes to mount in the container, in "host:container" format.
+            working_dir (str): The working directory in the container. Defaults to "/opt/ml/code".
+            requirements_file (Optional[str]): The requirements file path relative to the working directory, installed once per container.
+            requirements_path (Optional[str]): The host path of the requirements file, used to key the pool on its contents.
+        """
+        pool_key = get_pool_key(image, volumes, requirements_path)
+        self.reap_idle()
+
+        with self._lock:
+            idle_containers = self._idle.get(pool_key, [])
+            if idle_containers:
+                container = idle_containers.pop()
+                self._in_use[container.container_id] = container
+                print(f"Reusing warm container {container.container_id[:12]} (jobs run: {container.jobs_run})")
+                return container
+
+        container = self._start_container(pool_key, image, volumes, working_dir, requirements_file)
+        with self._lock:
+            self._in_use[container.container_id] = container
+        return container
+
+
+    def release(self, container: PooledContainer):
+        """
+        Return a container to the pool once a job is done, recycling it if it has run too many jobs.
+        """
+        container.jobs_run += 1
+        container.last_used = time.time()
+        with self._lock:
+            self._in_use.pop(container.container_id, None)
+
+        if container.jobs_run >= self.max_jobs_per_container:
+            print(f"Recycling container {container.container_id[:12]} after {container.jobs_run} jobs")
+            self._remove_container(container)
+            return
+
+        evicted = []
+        with self._lock:
+            self._idle.setdefault(container.pool_key, []).append(container)
+            idle_containers = sorted(
+                (c for containers in self._idle.values() for c in containers),
+                key=lambda c: c.last_used
+            )
+            for stale in idle_containers[:max(0, len(idle_containers) - self.max_containers)]:
+                self._idle[stale.pool_key].remove(stale)
+                evicted.append(stale)
+
+        for stale in evicted:
+            self._remove_container(stale)
+
+
+    def discard(self, container: PooledContainer):
+        """
+        Remove a container instead of returning it to the pool, e.g. when a job was interrupted.
+        """
+        with self._lock:
+            self._in_use.pop(container.container_id, None)
+        self._remove_container(container)
+
+
+    def exec(self, container: PooledContainer, command: str, environment: Optional[List[str]] = None, working_dir: str = "/opt/ml/code") -> int:
+        """
+        Run a command inside a pooled container and print the output in real-time.
+
+        Args:
+            container (PooledContainer): The container to run the command in.
+            command (str): The shell command to run.
+            environment (Optional[List[str]]): The per-job environment variables in "KEY=VALUE" format.
+            working_dir (str): The working directory for the command. Defaults to "/opt/ml/code".
+
+        Returns:
+            int: The exit code of the command.
+        """
+        docker_command = ["docker", "exec", "-w", working_dir]
+        for variable in environment or []:
+            docker_command.extend(["-e", variable])
+        docker_command.extend([container.container_id, "/bin/bash", "-c", command])
+
+        process = subprocess.Popen(docker_command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        for line in process.stdout:
+            print(line, end='')
+        return process.wait()
+
+
+    def reap_idle(self):
+        """
+        Remove containers that have been idle for longer than the idle timeout.
+        """
+        now = time.time()
+        expired = []
+        with self._lock:
+            for pool_key, containers in self._idle.items():
+                for container in list(containers):
+                    if now - container.last_used > self.idle_timeout:
+                        containers.remove(container)
+                        expired.append(container)
+
+        for container in expired:
+            print(f"Removing idle container {container.container_id[:12]}")
+            self._remove_container(container)
+
+
+    def _reap_periodically(self):
+        # Checked a few times per timeout, so containers are removed at most ~25% past it
+        interval = max(1.0, min(self.idle_timeout / 4, 60.0))
+        while not self._stopped.wait(interval):
+            self.reap_idle()
+
+
+    def shutdown(self):
+        """
+        Stop reaping and remove all containers of the pool, idle ones and the ones still running a job.
+        """
+        self._stopped.set()
+        with self._lock:
+            containers = [c for containers in self._idle.values() for c in containers] + list(self._in_use.values())
+            self._idle = {}
+            self._in_use = {}
+
+        for container in containers:
+            self._remove_container(container)
+
+
+    def _start_container(self, pool_key: str, image: str, volumes: List[str], working_dir: str, requirements_file: Optional[str]) -> PooledContainer:
+        command = ["docker", "run", "--detach", "--rm", "--label", f"{constants.CONTAINER_POOL_LABEL}={pool_key}", "-w", working_dir]
+        for volume in volumes:
+            command.extend(["-v", volume])
+        command.extend([image, "tail", "-f", "/dev/null"])
+
+        print(f"Starting warm container: {command}")
+        result = subprocess.run(command, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"Failed to start container: {result.stderr.strip()}")
+
+        container = PooledContainer(container_id=result.stdout.strip(), pool_key=pool_key)
+
+        if requirements_file:
+            print(f"Installing {requirements_file} in container {container.container_id[:12]}")
+            return_code = self.exec(container, f"pip install --no-cache-dir -r {requirements_file}", working_dir=working_dir)
+            if return_code != 0:
+                self._remove_container(container)
+                raise RuntimeError(f"Failed to install {requirements_file} in the container")
+
+        return container
+
+
+    def _remove_container(self, container: PooledContainer):
+        subprocess.run(["docker", "rm", "--force", container.container_id], capture_output=True, text=True)
@@ -0,0 +1,181 @@
+import numpy as np
+import os
+
+# Arrays saved as one .npy file each, so they can be memory-mapped when loading
+ARRAY_NAMES = ["feature", "threshold", "left", "right", "missing_go_to_left", "leaf_values", "roots", "classes", "is_leaf", "children"]
+
+# Rows scored per traversal, bounds the (trees x rows) node index arrays for large batches
+DEFAULT_BATCH_SIZE = 8192
+
+
+class CompiledForest:
+    def __init__(self, feature, threshold, left, right, missing_go_to_left, leaf_values, roots, classes, max_depth,
+                 is_leaf=None, children=None):
+        """
+        CompiledForest class to score a RandomForestClassifier from packed NumPy arrays.
+
+        The nodes of all trees are concatenated into contiguous arrays indexed by global node ID, with the
+        children of leaves pointing back at the leaf itself. A batch is scored by moving one node index per
+        (tree, row) pair down one level at a time, so every level is a handful of vectorized operations over all
+        trees and rows instead of a Python-level call per tree. Pairs that reached a leaf are dropped from the
+        next levels.
+
+        Predictions are bit-identical to sklearn's: rows are cast to float32 and compared to the float64
+        thresholds like sklearn does, and the normalized leaf probabilities are summed in estimator order before
+        dividing by the number of trees.
+
+        Attributes:
+            feature (np.ndarray): The feature each node splits on (0 for leaves).
+            threshold (np.ndarray): The threshold of each node, rows go left when `x[feature] <= threshold`.
+            left (np.ndarray): The global ID of each node's left child.
+            right (np.ndarray): The global ID of each node's right child.
+            missing_go_to_left (np.ndarray): Whether rows with a missing (NaN) feature go to the left child.
+            leaf_values (np.ndarray): The class probabilities of each node, (nodes, classes).
+            roots (np.ndarray): The global ID of the root of each tree.
+            classes (np.ndarray): The class labels.
+            max_depth (int): The depth of the deepest tree.
+            is_leaf (np.ndarray): Whether each node is a leaf, derived from `left` if not given.
+            children (np.ndarray): The left and right child of each node interleaved, derived from `left` and
+                `right` if not given.
+        """
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.missing_go_to_left = missing_go_to_left
+        self.leaf_values = leaf_values
+        self.roots = roots
+        self.classes = classes
+        self.max_depth = int(max_depth)
+        self.is_leaf = self.left == np.arange(len(self.left)) if is_leaf is None else is_leaf
+        # The children of node i are at 2 * i (left) and 2 * i + 1 (right), so a step is a single gather
+        self.children = np.ascontiguousarray(np.stack([self.left, self.right], axis=1).ravel()) if children is None else children
+
+
+    @classmethod
+    def from_sklearn(cls, forest):
+        """
+        Flatten a fitted single-output RandomForestClassifier.
+        """
+        if getattr(forest, "n_outputs_", 1) != 1:
+            raise ValueError("Only single-output forests can be compiled")
+
+        features, thresholds, lefts, rights, missing_lefts, values, roots = [], [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            node_ids = np.arange(tree.node_count)
+            is_leaf = tree.children_left == -1
+
+            roots.append(offset)
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(tree.threshold)
+            lefts.append(np.where(is_leaf, node_ids, tree.children_left) + offset)
+            rights.append(np.where(is_leaf, node_ids, tree.children_right) + offset)
+            missing_left = getattr(tree, "missing_go_to_left", None)
+            missing_lefts.append(np.zeros(tree.node_count, dtype=bool) if missing_left is None else missing_left.astype(bool))
+
+            # Normalized like DecisionTreeClassifier.predict_proba does
+            value = tree.value[:, 0, :forest.n_classes_].astype(np.float64)
+            normalizer = value.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            values.append(value / normalizer)
+
+            offset += tree.node_count
+            max_depth = max(max_depth, tree.max_depth)
+
+        return cls(
+            feature=np.ascontiguousarray(np.concatenate(features), dtype=np.intp),
+            threshold=np.ascontiguousarray(np.concatenate(thresholds), dtype=np.float64),
+            left=np.ascontiguousarray(np.concatenate(lefts), dtype=np.intp),
+            right=np.ascontiguousarray(np.concatenate(rights), dtype=np.intp),
+            missing_go_to_left=np.ascontiguousarray(np.concatenate(missing_lefts)),
+            leaf_values=np.ascontiguousarray(np.concatenate(values)),
+            roots=np.asarray(roots, dtype=np.intp),
+            classes=np.asarray(forest.classes_),
+            max_depth=max_depth
+        )
+
+
+    def _leaves(self, X):
+        n_trees, (n_rows, n_features) = len(self.roots), X.shape
+        X_flat = np.ascontiguousarray(X).ravel()
+        has_missing = np.isnan(X_flat).any()
+        nodes = np.repeat(self.roots, n_rows)
+        row_offsets = np.tile(np.arange(n_rows) * n_features, n_trees)
+
+        # Pairs that reached a leaf are written to `nodes` and dropped
+        active = np.arange(len(nodes))
+        current = nodes.copy()
+        for _ in range(self.max_depth + 1):
+            internal = ~self.is_leaf[current]
+            if not internal.all():
+                nodes[active[~internal]] = current[~internal]
+                active, current, row_offsets = active[internal], current[internal], row_offsets[internal]
+            if not len(active):
+                break
+
+            values = X_flat[row_offsets + self.feature[current]]
+            # NaN compares False, so missing values only go right when the node sends them right
+            go_right = values > self.threshold[current]
+            if has_missing:
+                go_right |= np.isnan(values) & ~self.missing_go_to_left[current]
+            current = self.children[2 * current + go_right]
+
+        return nodes.reshape(n_trees, n_rows)
+
+
+    def predict_proba(self, X, batch_size=DEFAULT_BATCH_SIZE):
+        # sklearn scores float32 rows, a float32 value compared to a float64 threshold is widened exactly
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+
+        proba = np.empty((X.shape[0], len(self.classes)), dtype=np.float64)
+        for start in range(0, X.shape[0], batch_size):
+            leaves = self._leaves(X[start:start + batch_size])
+            batch_proba = np.zeros((leaves.shape[1], len(self.classes)), dtype=np.float64)
+            # Summed tree by tree in estimator order, like sklearn, so the result is bit-identical
+            for tree_leaves in leaves:
+                batch_proba += self.leaf_values[tree_leaves]
+            batch_proba /= len(self.roots)
+            proba[start:start + batch_size] = batch_proba
+
+        return proba
+
+
+    def predict(self, X, batch_size=DEFAULT_BATCH_SIZE):
+        return self.classes.take(np.argmax(self.predict_proba(X, batch_size), axis=1), axis=0)
+
+
+    def save(self, path):
+        """
+        Save the forest to the directory `path`, as one .npy file per array.
+        """
+        os.makedirs(path, exist_ok=True)
+        for name in ARRAY_NAMES:
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name), allow_pickle=False)
+        np.save(os.path.join(path, "max_depth.npy"), np.asarray(self.max_depth), allow_pickle=False)
+
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """
+        Load a forest saved by `save`.
+
+        With mmap_mode='r' the arrays are mapped read-only from the files instead of being read into memory, so
+        every process that loads the same directory shares one copy of the nodes through the page cache. The
+        derived arrays are saved too, so loading allocates nothing per node.
+        """
+        # np.asarray drops the np.memmap subclass (and its per-operation overhead) without copying the mapping
+        arrays = {
+            name: np.asarray(np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode, allow_pickle=False))
+            for name in ARRAY_NAMES
+        }
+        max_depth = np.load(os.path.join(path, "max_depth.npy"), allow_pickle=False)
+        return cls(max_depth=max_depth, **arrays)
+
+
+def compile_forest(forest):
+    return CompiledForest.from_sklearn(forest)
@@ -0,0 +1,128 @@
+from flask import Flask, request, jsonify
+import pandas as pd
+import numpy as np
+import threading
+import argparse
+import io
+import joblib
+import os
+
+from forest_compiler import CompiledForest
+
+FEATURES = ["Pclass", "Sex", "Age", "SibSp", "Parch", "Fare", "Embarked"]
+
+DEFAULT_MODEL_PATH = os.path.join(os.environ.get("MODEL_OUTPUT_PATH", "model"), "forest")
+DEFAULT_SKLEARN_MODEL_PATH = os.path.join(os.environ.get("MODEL_OUTPUT_PATH", "model"), "model.joblib")
+
+# Batches of up to this many rows are scored by the compiled forest, larger ones by the sklearn model. The compiled
+# forest is ~20x faster for single rows but its throughput levels off, sklearn's one-tree-at-a-time traversal
+# overtakes it at ~400 rows (and is ~3x faster at 10,000 rows), see benchmarks/bench_forest_compiler.py
+COMPILED_MAX_BATCH_SIZE = int(os.environ.get("COMPILED_MAX_BATCH_SIZE", 400))
+
+app = Flask(__name__)
+
+model = None
+sklearn_model = None
+sklearn_model_path = os.environ.get("SKLEARN_MODEL_PATH", DEFAULT_SKLEARN_MODEL_PATH)
+model_lock = threading.Lock()
+
+
+def load_model(model_path):
+    # The compiled forest's .npy arrays are memory-mapped read-only instead of copied, so every server worker on
+    # the host shares one copy of the nodes through the page cache
+    print(f"Loading model from {model_path}")
+    return CompiledForest.load(model_path, mmap_mode='r')
+
+
+def load_sklearn_model(model_path):
+    # Not memory-mapped, sklearn's trees copy their arrays when unpickled. Only loaded once a large batch arrives
+    print(f"Loading sklearn model from {model_path}")
+    return joblib.load(model_path)
+
+
+def get_model():
+    global model
+    if model is None:
+        with model_lock:
+            if model is None:
+                model = load_model(os.environ.get("MODEL_PATH", DEFAULT_MODEL_PATH))
+    return model
+
+
+def get_sklearn_model():
+    global sklearn_model
+    if sklearn_model is None:
+        with model_lock:
+            if sklearn_model is None:
+                sklearn_model = load_sklearn_model(sklearn_model_path)
+    return sklearn_model
+
+
+def parse_features(req):
+    """
+    Parse a batch of rows into a (rows, features) float array, from either columnar JSON
+    ({"Pclass": [3, 1], "Sex": [0, 1], ...}) or CSV with a header row. Columns other than the features are ignored.
+    """
+    if req.mimetype in ("text/csv", "application/csv"):
+        columns = pd.read_csv(io.StringIO(req.get_data(as_text=True)))
+    else:
+        columns = req.get_json(force=True, silent=True)
+        if not isinstance(columns, dict):
+            raise ValueError("Expected a JSON object mapping each feature to a list of values")
+
+    missing = [feature for feature in FEATURES if feature not in columns]
+    if missing:
+        raise ValueError(f"Missing features: {', '.join(missing)}")
+
+    try:
+        X = np.column_stack([np.asarray(columns[feature], dtype=np.float64) for feature in FEATURES])
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Features must be numeric columns of the same length: {e}")
+
+    if np.isnan(X).any():
+        raise ValueError("Features must not contain missing values")
+    return X
+
+
+@app.route('/health', methods=['GET'])
+def health():
+    return jsonify({'status': 'ok'})
+
+
+@app.route('/predict', methods=['POST'])
+def predict():
+    try:
+        X = parse_features(request)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Score the whole batch in one call, both models give bit-identical probabilities
+    if len(X) > COMPILED_MAX_BATCH_SIZE:
+        clf = get_sklearn_model()
+        classes = clf.classes_
+    else:
+        clf = get_model()
+        classes = clf.classes
+    probabilities = clf.predict_proba(X)
+    predictions = classes[np.argmax(probabilities, axis=1)]
+
+    return jsonify({
+        'predictions': predictions.tolist(),
+        'probabilities': {str(cls): probabilities[:, i].tolist() for i, cls in enumerate(classes)}
+    })
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Serve the trained RandomForestClassifier.')
+    parser.add_argument('--model_path', type=str, default=DEFAULT_MODEL_PATH, help='Path to the compiled forest directory saved by train.py.')
+    parser.add_argument('--sklearn_model_path', type=str, default=DEFAULT_SKLEARN_MODEL_PATH, help='Path to the sklearn model saved by train.py, scores large batches.')
+    parser.add_argument('--port', type=int, default=8080, help='Port to run the server on.')
+
+    args = parser.parse_args()
+
+    # Other WSGI servers (e.g. several gunicorn workers) load the models from the MODEL_PATH and SKLEARN_MODEL_PATH
+    # environment variables
+    model = load_model(args.model_path)
+    sklearn_model_path = args.sklearn_model_path
+
+    app.run(host='0.0.0.0', port=args.port)
@@ -3,14 +3,85 @@ from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, confusion_matrix
 import pandas as pd
 import argparse
+import numpy as np
+import joblib
+import shutil
+import json
 import os
 
+from forest_compiler import compile_forest
+
+MODEL_FILE_NAME = "model.joblib"
+COMPILED_MODEL_DIR_NAME = "forest"
+
+def get_cache_dir(data_path):
+    return f"{data_path}.cache"
+
+def read_cached_arrays(data_path):
+    """
+    Read the feature matrix and labels of the CSV from its binary cache, if the cache is still valid.
+
+    Both are memory-mapped read-only, X is used as is, without copying it into memory first.
+    """
+    cache_dir = get_cache_dir(data_path)
+    try:
+        with open(os.path.join(cache_dir, "meta.json")) as f:
+            meta = json.load(f)
+        stat = os.stat(data_path)
+        if meta["size"] != stat.st_size or meta["mtime_ns"] != stat.st_mtime_ns:
+            return None
+        X = np.load(os.path.join(cache_dir, "X.npy"), mmap_mode='r')
+        y = np.load(os.path.join(cache_dir, "y.npy"), mmap_mode='r')
+    except (OSError, ValueError, KeyError):
+        return None
+    return X, y
+
+def to_arrays(data):
+    """
+    Convert the CSV columns to a float32 (rows, features) feature matrix, the dtype the model scores features in,
+    and the last column to labels of the smallest dtype that holds them, e.g. int8.
+    """
+    X = np.ascontiguousarray(data.iloc[:, :-1].to_numpy(dtype=np.float32))
+    labels = data.iloc[:, -1]
+    if pd.api.types.is_integer_dtype(labels):
+        labels = pd.to_numeric(labels, downcast="integer")
+    return X, labels.to_numpy()
+
+def write_cached_arrays(data_path, X, y):
+    """
+    Write the feature matrix and labels to .npy files, keyed by the size and modification time of the CSV.
+    """
+    if y.dtype == object:
+        return
+
+    stat = os.stat(data_path)
+    cache_dir = get_cache_dir(data_path)
+    temp_dir = f"{cache_dir}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(temp_dir, exist_ok=True)
+        np.save(os.path.join(temp_dir, "X.npy"), X)
+        np.save(os.path.join(temp_dir, "y.npy"), y)
+        with open(os.path.join(temp_dir, "meta.json"), "w") as f:
+            json.dump({"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}, f)
+
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        os.replace(temp_dir, cache_dir)
+        print(f"Cached the feature matrix in {cache_dir}")
+    except OSError as e:
+        # e.g. a read-only data directory, the CSV is parsed again next time
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        print(f"Could not cache the feature matrix in {cache_dir}: {e}")
+
 def load_data(data_path=None):
     if data_path:
         print(f"Loading data from {data_path}")
-        data = pd.read_csv(data_path)
-        X = data.iloc[:, :-1].values
-        y = data.iloc[:, -1].values
+        cached = read_cached_arrays(data_path)
+        if cached:
+            print(f"Using the feature matrix cached in {get_cache_dir(data_path)}")
+            X, y = cached
+        else:
+            X, y = to_arrays(pd.read_csv(data_path))
+            write_cached_arrays(data_path, X, y)
     else:
         raise ValueError("Data path not provided")
     return X, y
@@ -58,6 +129,20 @@ def main(args):
     print(f"Model precision: {precision:.2f}")
     print(f"Model recall: {recall:.2f}")
     print(f"Model F1 score: {f1:.2f}")
+
+    # Save the model
+    os.makedirs(args.output_path, exist_ok=True)
+    model_path = os.path.join(args.output_path, MODEL_FILE_NAME)
+    joblib.dump(best_clf, model_path)
+    print(f"Model saved to {model_path}")
+
+    # Export the forest as packed node arrays for low-latency scoring, serve.py memory-maps them, see forest_compiler.py
+    compiled_forest = compile_forest(best_clf)
+    if not np.array_equal(compiled_forest.predict_proba(X_test), best_clf.predict_proba(X_test)):
+        raise ValueError("Compiled forest predictions differ from the trained model")
+    compiled_path = os.path.join(args.output_path, COMPILED_MODEL_DIR_NAME)
+    compiled_forest.save(compiled_path)
+    print(f"Compiled forest saved to {compiled_path}")
     
 
 if __name__ == "__main__":
@@ -5,6 +5,8 @@ import subprocess
 import constants
 import textwrap
 
+from container_pool import ContainerPool
+
 import os
 os.environ['PATH'] += ':/usr/local/bin' # I need to add this to the PATH to use docker-compose
 
@@ -46,10 +48,13 @@ class SourceCodeConfig:
             Outputs artifacts from your training scripts should be saved to the following:
                 - "/opt/ml/model/" or os.enviorn["MODEL_OUTPUT_PATH"] for model artifacts
                 - "/opt/ml/data/" or os.enviorn["DATA_OUTPUT_PATH"] for other artifacts
+        requirements_file (str): The path to a requirements file within the source code directory. When set, it is installed 
+            before the command runs (once per warm container when a ContainerPool is used).
 
     """
     source_code_dir: Optional[str] = None
     command: Optional[str] = None
+    requirements_file: Optional[str] = None
 
 @dataclass
 class ImageSpec:
@@ -69,19 +74,22 @@ class ImageSpec:
 
 
 class LocalTrainer:
-    def __init__(self, image: str | ImageSpec, output_path: str):
+    def __init__(self, image: str | ImageSpec, output_path: str, container_pool: Optional[ContainerPool] = None):
         """LocalTrainer class to train a model locally.
 
         Args:
             image (str | ImageSpec): The image to be used for training. This can be a URI or an ImageSpec object.
             output_path (str): The output path where the output training artifacts and data will be stored. Can be a local or S3 path.
+            container_pool (Optional[ContainerPool]): A pool of warm containers to run jobs in with `docker exec` instead of 
+                starting a new container with docker compose for every job. Defaults to None.
         """
         self.image = image
         self.output_path = output_path
+        self.container_pool = container_pool
 
 
-    def _create_docker_compose_file(self, image: str, output_path: str, input_data_channels: Optional[List[DataChannel]], source_code_config: Optional[SourceCodeConfig]):
-        volumes = ""
+    def _get_volumes_and_environment(self, output_path: str, input_data_channels: Optional[List[DataChannel]], source_code_config: Optional[SourceCodeConfig]):
+        volumes = []
 
         # Convert output_path to absolute path
         abs_output_path = os.path.abspath(output_path)
@@ -89,38 +97,45 @@ class LocalTrainer:
         os.makedirs(os.path.join(abs_output_path, "data"), exist_ok=True)
 
         # Add the output paths as a volume
-        volumes += f"- {abs_output_path}/model:/opt/ml/model\n"
-        volumes += f"- {abs_output_path}/data:/opt/ml/data\n"
+        volumes.append(f"{abs_output_path}/model:/opt/ml/model")
+        volumes.append(f"{abs_output_path}/data:/opt/ml/data")
 
         # Add the input data channels as volumes
         if input_data_channels:
             for channel in input_data_channels:
                 abs_channel_path = os.path.abspath(channel.path)
-                volumes += f"- {abs_channel_path}:/opt/ml/input/{channel.channel_name}\n"
+                volumes.append(f"{abs_channel_path}:/opt/ml/input/{channel.channel_name}")
         
         # Add the source code configs
         if source_code_config:
             abs_source_code_dir = os.path.abspath(source_code_config.source_code_dir)
-            volumes += f"- {abs_source_code_dir}:/opt/ml/code\n"
-            
-            command = ""
-            if source_code_config.command:
-                command += source_code_config.command
+            volumes.append(f"{abs_source_code_dir}:/opt/ml/code")
         
         # Create the environment variables
-        environment = f"- MODEL_OUTPUT_PATH=/opt/ml/model\n"
-        environment += f"- DATA_OUTPUT_PATH=/opt/ml/data\n"
+        environment = ["MODEL_OUTPUT_PATH=/opt/ml/model", "DATA_OUTPUT_PATH=/opt/ml/data"]
 
         if input_data_channels:
             for channel in input_data_channels:
-                environment += f"- INPUT_DATA_{channel.channel_name.upper()}=/opt/ml/input/{channel.channel_name}\n"
+                environment.append(f"INPUT_DATA_{channel.channel_name.upper()}=/opt/ml/input/{channel.channel_name}")
+
+        return volumes, environment
+
+
+    def _create_docker_compose_file(self, image: str, output_path: str, input_data_channels: Optional[List[DataChannel]], source_code_config: Optional[SourceCodeConfig]):
+        volumes, environment = self._get_volumes_and_environment(output_path, input_data_channels, source_code_config)
+
+        command = ""
+        if source_code_config and source_code_config.command:
+            command += source_code_config.command
+            if source_code_config.requirements_file:
+                command = f"pip install -r {source_code_config.requirements_file} && {command}"
 
         # Create the Docker Compose file
         docker_compose_file = constants.DOCKER_COMPOSE_FILE_TEMPLATE.format(
             image=image,
-            volumes=textwrap.indent(volumes, " " * 6),
+            volumes=textwrap.indent("".join(f"- {volume}\n" for volume in volumes), " " * 6),
             command=command,
-            environment=textwrap.indent(environment, " " * 6)
+            environment=textwrap.indent("".join(f"- {variable}\n" for variable in environment), " " * 6)
         )
         print(f"Docker Compose file:\n{docker_compose_file}")
 
@@ -128,6 +143,41 @@ class LocalTrainer:
         with open(constants.DOCKER_COMPOSE_FILE_NAME, "w") as f:
             f.write(docker_compose_file)
 
+
+    def _run_in_pool(self, image: str, output_path: str, input_data_channels: Optional[List[DataChannel]], source_code_config: Optional[SourceCodeConfig]):
+        # Pooled containers run a no-op command, so there is no image default command to fall back to
+        if not (source_code_config and source_code_config.command):
+            raise ValueError("Running in a container pool requires a source code config with a command")
+
+        volumes, environment = self._get_volumes_and_environment(output_path, input_data_channels, source_code_config)
+
+        requirements_file = None
+        requirements_path = None
+        if source_code_config and source_code_config.requirements_file:
+            requirements_file = source_code_config.requirements_file
+            requirements_path = os.path.join(source_code_config.source_code_dir, requirements_file)
+
+        container = self.container_pool.acquire(
+            image=image,
+            volumes=volumes,
+            requirements_file=requirements_file,
+            requirements_path=requirements_path
+        )
+
+        # The command runs through bash directly instead of docker compose, so undo compose's "$$" escaping
+        command = source_code_config.command.replace("$$", "$")
+
+        try:
+            return_code = self.container_pool.exec(container, command, environment=environment)
+        except BaseException:
+            self.container_pool.discard(container)
+            raise
+        self.container_pool.release(container)
+
+        if return_code != 0:
+            raise RuntimeError(f"Training job failed with exit code {return_code}")
+
+
     def run(
             self, 
             source_code_config: Optional[SourceCodeConfig] = None,
@@ -142,6 +192,12 @@ class LocalTrainer:
                 To reference the data for a DataChannel with name "validation", use path "/opt/ml/input/validation/" within the container.
         """
 
+        # Jobs without a command run the image's default command, which only the Docker Compose path does
+        if self.container_pool and source_code_config and source_code_config.command:
+            image = self.image.image if isinstance(self.image, ImageSpec) else self.image
+            self._run_in_pool(image=image, output_path=self.output_path, input_data_channels=input_data_channels, source_code_config=source_code_config)
+            return
+
         # Create the Dockerfile for training
         self._create_docker_compose_file(image=self.image, output_path=self.output_path, input_data_channels=input_data_channels, source_code_config=source_code_config)
 
@@ -0,0 +1,139 @@
+from typing import List, Optional
+from dataclasses import dataclass
+import os
+import re
+
+from docker_utils import DockerComposeService, DockerComposeVolume, DependsOnService, parse_size
+
+ARTIFACT_VOLUME_PREFIX = "docker-ml-learning-artifact"
+ARTIFACT_MOUNT_DIR = "/opt/ml/artifacts"
+
+# Used for the helper containers when the pipeline has no default image
+ARTIFACT_HELPER_IMAGE = "busybox:1.36"
+
+ARTIFACT_KEEPER_STAGE_NAME = "artifact-keeper"
+ARTIFACT_EXPORT_STAGE_NAME = "artifact-export"
+ARTIFACT_RESET_STAGE_NAME = "artifact-reset"
+ARTIFACT_STAGE_NAMES = (ARTIFACT_KEEPER_STAGE_NAME, ARTIFACT_RESET_STAGE_NAME, ARTIFACT_EXPORT_STAGE_NAME)
+
+ARTIFACT_NAME_PATTERN = r"[A-Za-z0-9][A-Za-z0-9_.-]*"
+
+
+@dataclass
+class Artifact:
+    """
+    Artifact class for data passed between pipeline stages through a Docker-managed volume instead of a host
+    bind mount.
+
+    A stage that lists the artifact in its `outputs` produces it, and every stage that lists it in its `inputs`
+    gets it mounted read-only and runs after the producer.
+
+    Attributes:
+        name (str): The name of the artifact, unique within the pipeline.
+        path (str): The path the artifact is mounted at inside the containers. Defaults to
+            "/opt/ml/artifacts/<name>". Consumers may mount it at a different path than the producer.
+        size (str): The expected size of the artifact, e.g. "512m". Artifacts that fit the builder's
+            `tmpfs_artifact_size` are kept in RAM. Only the producer's value is used.
+        persist_path (str): A host directory to copy the artifact to once all transient stages completed.
+            Only the producer's value is used. Defaults to None (the artifact is not exported).
+    """
+    name: str
+    path: Optional[str] = None
+    size: Optional[str] = None
+    persist_path: Optional[str] = None
+
+    def __post_init__(self):
+        if not re.fullmatch(ARTIFACT_NAME_PATTERN, self.name):
+            raise ValueError(f"Invalid artifact name '{self.name}', must match {ARTIFACT_NAME_PATTERN}")
+        self.path = self.path or f"{ARTIFACT_MOUNT_DIR}/{self.name}"
+
+    @property
+    def volume_name(self) -> str:
+        return f"{ARTIFACT_VOLUME_PREFIX}-{self.name}"
+
+
+def fits_tmpfs(artifact: Artifact, tmpfs_size: Optional[str]) -> bool:
+    if not artifact.size or not tmpfs_size:
+        return False
+    return parse_size(artifact.size) <= parse_size(tmpfs_size)
+
+
+def get_artifact_volume(artifact: Artifact, tmpfs: bool = False) -> DockerComposeVolume:
+    """
+    Get the volume backing an artifact: a RAM-backed tmpfs volume sized to the artifact, or a regular named volume.
+    """
+    driver_opts = {"type": "tmpfs", "device": "tmpfs", "o": f"size={artifact.size}"} if tmpfs else None
+    return DockerComposeVolume(name=artifact.volume_name, driver_opts=driver_opts)
+
+
+def get_keeper_service(artifacts: List[Artifact], image: Optional[str]) -> DockerComposeService:
+    """
+    Get a detached service that keeps the tmpfs volumes of the given artifacts mounted.
+
+    The local volume driver unmounts a tmpfs volume, and so discards its content, as soon as no running
+    container uses it, which happens between a producer exiting and its consumers starting.
+    """
+    return DockerComposeService(
+        service_name=ARTIFACT_KEEPER_STAGE_NAME,
+        image=image or ARTIFACT_HELPER_IMAGE,
+        volumes=[f"{artifact.volume_name}:{ARTIFACT_MOUNT_DIR}/{artifact.name}" for artifact in artifacts],
+        entrypoint="tail",
+        command="-f /dev/null",
+        depends_on=[],
+        detach_on_build=True,
+        cpu_request=0.0,
+        inputs=[],
+        outputs=[]
+    )
+
+
+def get_reset_service(artifacts: List[Artifact], image: Optional[str]) -> DockerComposeService:
+    """
+    Get a service that empties the named volumes of the given artifacts before their producers run.
+
+    Unlike tmpfs volumes, named volumes keep their content across runs, so a producer writing fewer files than in
+    the previous run would otherwise leave stale files for its consumers and the export.
+    """
+    volumes = []
+    clear_commands = []
+    for artifact in artifacts:
+        artifact_dir = f"{ARTIFACT_MOUNT_DIR}/{artifact.name}"
+        volumes.append(f"{artifact.volume_name}:{artifact_dir}")
+        # The patterns cover hidden files, rm -f ignores the ones that match nothing
+        clear_commands.append(f"rm -rf {artifact_dir}/* {artifact_dir}/.[!.]* {artifact_dir}/..?*")
+
+    return DockerComposeService(
+        service_name=ARTIFACT_RESET_STAGE_NAME,
+        image=image or ARTIFACT_HELPER_IMAGE,
+        volumes=volumes,
+        entrypoint="/bin/sh",
+        command=f"-c '{' && '.join(clear_commands)}'",
+        depends_on=[],
+        cpu_request=0.0,
+        inputs=[],
+        outputs=[]
+    )
+
+
+def get_export_service(artifacts: List[Artifact], image: Optional[str], depends_on: List[DependsOnService]) -> DockerComposeService:
+    """
+    Get a service that copies the given artifacts to their `persist_path` on the host.
+    """
+    volumes = []
+    copy_commands = []
+    for artifact in artifacts:
+        volumes.append(f"{artifact.volume_name}:{ARTIFACT_MOUNT_DIR}/{artifact.name}:ro")
+        volumes.append(f"{os.path.abspath(artifact.persist_path)}:/export/{artifact.name}")
+        copy_commands.append(f"cp -a {ARTIFACT_MOUNT_DIR}/{artifact.name}/. /export/{artifact.name}/")
+
+    return DockerComposeService(
+        service_name=ARTIFACT_EXPORT_STAGE_NAME,
+        image=image or ARTIFACT_HELPER_IMAGE,
+        volumes=volumes,
+        entrypoint="/bin/sh",
+        command=f"-c '{' && '.join(copy_commands)}'",
+        depends_on=depends_on,
+        cpu_request=0.0,
+        inputs=[],
+        outputs=[]
+    )
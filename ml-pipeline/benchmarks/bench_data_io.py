@@ -0,0 +1,199 @@
+"""
+Benchmark the preprocessing -> training data handoff across storage formats and image dtypes.
+
+For every combination of storage format (compressed .npz, raw .npz, one memory-mapped .npy file per array) and
+dtype (uint8, float32, float64), the images are normalized and saved with preprocessing/process.py's functions, then
+loaded with training/train.py's load_training_data and read once in training-sized batches, the way model.fit reads
+them. Reported per combination:
+    size      bytes on disk
+    write     normalizing and saving, and the peak memory allocated while doing it
+    load      load_training_data, and the peak memory allocated by it and one pass over the batches
+    epoch     one pass over the training images in batches
+
+Peak memory is traced with tracemalloc, which counts NumPy's allocations but not memory-mapped pages (those live
+in the page cache and are shared between processes). Loads read from the page cache unless --drop_caches is
+given, which needs root on Linux.
+
+The load numbers of npy_mmap float images exclude the copy model.fit makes when it converts the whole training
+array to a tensor: training still holds the images in memory once, the mapping only avoids a second copy while
+loading.
+
+The images are CIFAR-10 shaped. By default they are synthetic: 8x8 blocks of random colors with pixel noise, which
+compress roughly like photos. --cifar uses the real dataset, which needs TensorFlow.
+
+Usage:
+    python benchmarks/bench_data_io.py --fraction 0.5
+    python benchmarks/bench_data_io.py --cifar --formats npz_compressed,npy_mmap --dtypes uint8,float32
+"""
+import argparse
+import gc
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+sys.path.insert(0, os.path.join(SRC_DIR, "preprocessing"))
+sys.path.insert(0, os.path.join(SRC_DIR, "training"))
+
+from process import DTYPES, STORAGE_FORMATS, load_cifar10, normalize_images, save_training_data
+from train import load_training_data
+
+CIFAR_TRAIN_SAMPLES = 50000
+CIFAR_TEST_SAMPLES = 10000
+NUM_CLASSES = 10
+
+
+def generate_synthetic_cifar(fraction, seed=42):
+    rng = np.random.default_rng(seed)
+
+    def images(count):
+        blocks = rng.integers(0, 256, (count, 8, 8, 3), dtype=np.uint8)
+        x = blocks.repeat(4, axis=1).repeat(4, axis=2).astype(np.int16)
+        x += rng.integers(-12, 13, x.shape, dtype=np.int16)
+        return np.clip(x, 0, 255).astype(np.uint8)
+
+    num_train_samples = int(CIFAR_TRAIN_SAMPLES * fraction)
+    num_test_samples = int(CIFAR_TEST_SAMPLES * fraction)
+    return (
+        images(num_train_samples),
+        rng.integers(0, NUM_CLASSES, (num_train_samples, 1), dtype=np.uint8),
+        images(num_test_samples),
+        rng.integers(0, NUM_CLASSES, (num_test_samples, 1), dtype=np.uint8)
+    )
+
+
+def drop_page_cache():
+    os.sync()
+    try:
+        with open("/proc/sys/vm/drop_caches", "w") as f:
+            f.write("3\n")
+        return True
+    except OSError:
+        return False
+
+
+def get_size(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+    return os.path.getsize(path)
+
+
+def read_epoch(x, batch_size):
+    # Materialize every batch as float32 like the model input, so lazy (memory-mapped) arrays are read in full
+    total = 0.0
+    for start in range(0, len(x), batch_size):
+        total += float(np.asarray(x[start:start + batch_size], dtype=np.float32).sum())
+    return total
+
+
+def run_combination(data, storage_format, dtype, normalize_value, batch_size, work_dir, drop_caches):
+    x_train, y_train, x_test, y_test = data
+    output_path = os.path.join(work_dir, f"{storage_format}-{dtype}")
+    os.makedirs(output_path)
+    result = {"format": storage_format, "dtype": dtype}
+
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    save_path = save_training_data(
+        output_path,
+        {
+            "x_train": normalize_images(x_train, normalize_value, dtype),
+            "y_train": y_train,
+            "x_test": normalize_images(x_test, normalize_value, dtype),
+            "y_test": y_test
+        },
+        storage_format=storage_format,
+        normalize_value=normalize_value if dtype == "uint8" else None
+    )
+    result["write_s"] = time.perf_counter() - start
+    result["write_peak_mb"] = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+    result["size_mb"] = get_size(save_path) / 1e6
+
+    if drop_caches and not drop_page_cache():
+        print("Could not drop the page cache, loads are read from memory")
+
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    loaded_x_train, _, loaded_x_test, _ = load_training_data(save_path)
+    result["load_s"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    checksum = read_epoch(loaded_x_train, batch_size)
+    result["epoch_s"] = time.perf_counter() - start
+    result["load_peak_mb"] = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+
+    # Every format and dtype must hand the same images to training, up to float32 rounding
+    expected = x_train[:16].astype(np.float64) / normalize_value
+    if not np.allclose(np.asarray(loaded_x_train[:16], dtype=np.float64), expected, atol=1e-6) or len(loaded_x_test) != len(x_test):
+        raise ValueError(f"{storage_format} {dtype} data does not match the original images")
+    result["checksum"] = checksum
+
+    del loaded_x_train, loaded_x_test
+    shutil.rmtree(output_path)
+    return result
+
+
+def print_table(results):
+    columns = [
+        ("format", "format", "{}"), ("dtype", "dtype", "{}"), ("size_mb", "size MB", "{:.1f}"),
+        ("write_s", "write s", "{:.2f}"), ("write_peak_mb", "write peak MB", "{:.1f}"),
+        ("load_s", "load s", "{:.3f}"), ("epoch_s", "epoch s", "{:.2f}"), ("load_peak_mb", "load peak MB", "{:.1f}")
+    ]
+    print("| " + " | ".join(header for _, header, _ in columns) + " |")
+    print("|" + "|".join("---" for _ in columns) + "|")
+    for result in results:
+        print("| " + " | ".join(template.format(result[key]) for key, _, template in columns) + " |")
+    print("\nnpy_mmap loads exclude the copy model.fit makes when it converts the training images to a tensor.")
+
+
+def main(args):
+    if args.cifar:
+        data = load_cifar10(args.fraction)
+    else:
+        data = generate_synthetic_cifar(args.fraction, args.seed)
+    print(f"{len(data[0])} training and {len(data[2])} test images of shape {data[0].shape[1:]}\n")
+
+    results = []
+    work_dir = tempfile.mkdtemp(dir=args.work_dir)
+    try:
+        for storage_format in args.formats:
+            for dtype in args.dtypes:
+                print(f"Benchmarking {storage_format} {dtype}")
+                results.append(run_combination(data, storage_format, dtype, args.normalize_value, args.batch_size, work_dir, args.drop_caches))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print()
+    print_table(results)
+
+    if args.output_path:
+        with open(args.output_path, "w") as f:
+            json.dump({"cifar": args.cifar, "fraction": args.fraction, "drop_caches": args.drop_caches, "results": results}, f, indent=2)
+        print(f"\nResults saved to {args.output_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the training data storage formats and dtypes.")
+    parser.add_argument("--fraction", type=float, default=0.5, help="Fraction of the CIFAR-10 size to use, the pipeline notebook uses 0.5.")
+    parser.add_argument("--cifar", action="store_true", help="Use the real CIFAR-10 images instead of synthetic ones.")
+    parser.add_argument("--formats", type=lambda value: value.split(","), default=STORAGE_FORMATS, help="Comma-separated storage formats.")
+    parser.add_argument("--dtypes", type=lambda value: value.split(","), default=DTYPES, help="Comma-separated image dtypes.")
+    parser.add_argument("--normalize_value", type=float, default=255.0, help="Value to normalize pixel values by.")
+    parser.add_argument("--batch_size", type=int, default=64, help="Batch size of the epoch pass, as in train.py.")
+    parser.add_argument("--drop_caches", action="store_true", help="Drop the page cache before every load (Linux, root).")
+    parser.add_argument("--work_dir", type=str, default=None, help="Directory to write the data to, defaults to the system temporary directory.")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed of the synthetic images.")
+    parser.add_argument("--output_path", type=str, default=None, help="Path to write the results to as JSON.")
+
+    args = parser.parse_args()
+    main(args)
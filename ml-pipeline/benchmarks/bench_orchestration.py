@@ -0,0 +1,186 @@
+"""
+Benchmark the overhead of the orchestration layer on synthetic pipelines of 10 to 10,000 stages.
+
+No Docker is needed: stages run on a FakeBackend that exits them immediately, so the timings only cover the
+builder, the compose file rendering and the scheduler. Every stage depends on up to two earlier stages.
+
+Measured per pipeline size:
+    command   get_command_and_entrypoint for every stage
+    build     adding every stage to a DockerMLPipelineBuilder
+    render    DockerComposeService.to_yaml for every stage and DockerComposeClient.to_yaml for the whole file
+    write     writing the compose file, then "rewriting" it unchanged (as on every compose_up)
+    launch    build_and_run_pipeline on the FakeBackend, from baking to the last stage exit
+
+Timings depend on the machine, so store the baseline on the machine the runs are compared on. A timing only counts
+as a regression if it is both more than --tolerance and more than --min_delta seconds slower than the baseline:
+the small pipelines take well under a millisecond, where a relative tolerance alone flags noise.
+
+Usage:
+    python benchmarks/bench_orchestration.py                     # run and compare to the stored baseline
+    python benchmarks/bench_orchestration.py --save_baseline     # run and store the results as the new baseline
+    python benchmarks/bench_orchestration.py --check             # exit with 1 if a timing regressed
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+from docker_utils import DockerComposeClient
+from execution_backend import FakeBackend
+from pipeline_builder import DockerMLPipelineBuilder, get_command_and_entrypoint
+from stage_cache import StageCache
+
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+DEFAULT_BASELINE_PATH = os.path.join(BENCHMARK_DIR, "baseline_orchestration.json")
+PHASES = ["command", "build", "render", "write", "launch"]
+MIN_CHECK_REPEATS = 3
+
+
+def get_dependencies(index):
+    # A layered DAG: stage i depends on stages i // 2 and i - 1
+    return sorted({f"stage-{dependency}" for dependency in (index // 2, index - 1) if 0 <= dependency < index})
+
+
+def build_pipeline(size, work_dir):
+    builder = DockerMLPipelineBuilder(
+        image="bench/image:latest",
+        source_code_dir=None,
+        backend=FakeBackend(),
+        log_dir=None,
+        console_logs=False,
+        cpu_budget=size,
+        stage_cache=StageCache(os.path.join(work_dir, ".pipeline_cache"))
+    )
+    for index in range(size):
+        builder.add_stage(
+            stage_name=f"stage-{index}",
+            command="python stage.py",
+            arguments=["--index", str(index), "--output_path", f"/data/{index}"],
+            environment=["OMP_NUM_THREADS=1"],
+            volumes=[f"{work_dir}/data:/data"],
+            depends_on=get_dependencies(index),
+            cpu_request=1.0
+        )
+    return builder
+
+
+def time_phases(size, work_dir):
+    timings = {}
+
+    start = time.perf_counter()
+    for index in range(size):
+        get_command_and_entrypoint(
+            entrypoint=None,
+            command="python stage.py",
+            arguments=["--index", str(index)],
+            requirements="requirements.txt"
+        )
+    timings["command"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    builder = build_pipeline(size, work_dir)
+    timings["build"] = time.perf_counter() - start
+
+    client = builder.compose_client
+    start = time.perf_counter()
+    for service in client.services:
+        service.to_yaml()
+    client.to_yaml()
+    timings["render"] = time.perf_counter() - start
+
+    compose_file = os.path.join(work_dir, "docker-compose.yml")
+    writer = DockerComposeClient(client.services)
+    stdout = sys.stdout
+    start = time.perf_counter()
+    try:
+        # create_compose_file prints the whole file
+        sys.stdout = open(os.devnull, "w")
+        writer.create_compose_file(compose_file)
+        writer.create_compose_file(compose_file)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    timings["write"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    try:
+        sys.stdout = open(os.devnull, "w")
+        builder.build_and_run_pipeline()
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    timings["launch"] = time.perf_counter() - start
+
+    return timings
+
+
+def run(sizes, repeats):
+    results = {}
+    for size in sizes:
+        runs = []
+        for _ in range(repeats):
+            with tempfile.TemporaryDirectory() as work_dir:
+                runs.append(time_phases(size, work_dir))
+        results[str(size)] = {phase: statistics.median(run[phase] for run in runs) for phase in PHASES}
+    return results
+
+
+def print_results(results, baseline, tolerance, min_delta):
+    regressions = []
+    print(f"{'stages':>8} {'phase':>8} {'seconds':>10} {'us/stage':>10} {'baseline':>10} {'change':>8}")
+    for size, timings in results.items():
+        for phase in PHASES:
+            seconds = timings[phase]
+            line = f"{size:>8} {phase:>8} {seconds:>10.4f} {seconds / int(size) * 1e6:>10.1f}"
+
+            previous = baseline.get(size, {}).get(phase)
+            if previous:
+                change = seconds / previous - 1
+                line += f" {previous:>10.4f} {change:>+7.0%}"
+                if change > tolerance and seconds - previous > min_delta:
+                    line += "  REGRESSION"
+                    regressions.append((size, phase))
+            print(line)
+    return regressions
+
+
+def main(args):
+    baseline = {}
+    if os.path.exists(args.baseline_path):
+        with open(args.baseline_path) as f:
+            baseline = json.load(f)["results"]
+
+    results = run(args.sizes, args.repeats)
+    regressions = print_results(results, baseline, args.tolerance, args.min_delta)
+
+    if args.save_baseline:
+        with open(args.baseline_path, "w") as f:
+            json.dump({"python": sys.version.split()[0], "repeats": args.repeats, "results": results}, f, indent=2)
+        print(f"Baseline saved to {args.baseline_path}")
+
+    if regressions:
+        print(f"{len(regressions)} timings are more than {args.tolerance:.0%} and {args.min_delta * 1e3:.0f} ms slower than the baseline")
+        if args.check:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the orchestration overhead of the pipeline builder.")
+    parser.add_argument("--sizes", type=lambda value: [int(size) for size in value.split(",")], default=DEFAULT_SIZES, help="Comma-separated pipeline sizes.")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per size, the median is reported.")
+    parser.add_argument("--baseline_path", type=str, default=DEFAULT_BASELINE_PATH, help="Path of the stored baseline.")
+    parser.add_argument("--save_baseline", action="store_true", help="Store the results as the new baseline.")
+    parser.add_argument("--check", action="store_true", help="Exit with 1 if a timing regressed beyond the tolerance.")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="Allowed slowdown against the baseline, 0.5 is 50%%.")
+    parser.add_argument("--min_delta", type=float, default=0.005, help="Slowdowns of fewer seconds than this are not regressions.")
+
+    args = parser.parse_args()
+    if args.check and args.repeats < MIN_CHECK_REPEATS:
+        parser.error(f"--check needs --repeats of at least {MIN_CHECK_REPEATS}, the median of fewer runs is too noisy")
+    main(args)
@@ -0,0 +1,209 @@
+from typing import Callable, Dict, List, Optional, Tuple
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+import bisect
+import queue
+import time
+
+
+@dataclass
+class StageResult:
+    stage_name: str
+    return_code: Optional[int]
+    start_time: float
+    end_time: float
+
+    @property
+    def duration(self) -> float:
+        return self.end_time - self.start_time
+
+
+class DAGScheduler:
+    def __init__(
+            self,
+            dependencies: Dict[str, List[str]],
+            start_stage: Callable[[str], None],
+            stop_stage: Optional[Callable[[str], None]] = None,
+            stage_costs: Optional[Dict[str, float]] = None,
+            resource_budget: Optional[float] = None
+    ):
+        """
+        DAGScheduler class to run pipeline stages as soon as all of their dependencies have completed.
+
+        Stages are started without blocking the scheduler, and their completion is reported back through
+        `notify_exit` (e.g. from container exit events), which immediately starts the stages that were waiting
+        on them. Independent stages run concurrently as long as the sum of their costs fits in the resource
+        budget. A stage whose cost exceeds the whole budget is only started when nothing else is running. The
+        first failing stage stops the scheduling of new stages and the running ones are stopped.
+
+        Attributes:
+            dependencies (Dict[str, List[str]]): The names of the stages each stage depends on, in the order
+                the stages were added.
+            start_stage (Callable[[str], None]): Starts a stage. `notify_exit` must be called once the stage exits,
+                which may happen before `start_stage` returns (e.g. for skipped stages).
+            stop_stage (Optional[Callable[[str], None]]): Stops a running stage when another stage fails.
+            stage_costs (Optional[Dict[str, float]]): The resources (e.g. CPUs) reserved by each stage while it runs.
+                Defaults to 1 per stage.
+            resource_budget (Optional[float]): The total resources available on the host. Defaults to no limit.
+        """
+        self.dependencies = dependencies
+        self.start_stage = start_stage
+        self.stop_stage = stop_stage
+        self.stage_costs = stage_costs or {}
+        self.resource_budget = resource_budget
+        self.results: Dict[str, StageResult] = {}
+
+        self._dependents: Dict[str, List[str]] = {stage_name: [] for stage_name in dependencies}
+        for stage_name, stage_dependencies in dependencies.items():
+            for dependency in dict.fromkeys(stage_dependencies):
+                if dependency in self._dependents:
+                    self._dependents[dependency].append(stage_name)
+
+        self._validate()
+
+
+    def _validate(self):
+        for stage_name, dependencies in self.dependencies.items():
+            for dependency in dependencies:
+                if dependency not in self.dependencies:
+                    raise ValueError(f"Stage '{stage_name}' depends on unknown stage '{dependency}'")
+
+        # Kahn's algorithm, any stage left over is part of a cycle
+        remaining = {stage_name: len(set(dependencies)) for stage_name, dependencies in self.dependencies.items()}
+        ready = [stage_name for stage_name, count in remaining.items() if count == 0]
+        visited = 0
+        while ready:
+            stage_name = ready.pop()
+            visited += 1
+            for dependent in self.dependents(stage_name):
+                remaining[dependent] -= 1
+                if remaining[dependent] == 0:
+                    ready.append(dependent)
+
+        if visited != len(self.dependencies):
+            cycle = [stage_name for stage_name, count in remaining.items() if count > 0]
+            raise ValueError(f"Pipeline stages have a dependency cycle: {cycle}")
+
+
+    def dependents(self, stage_name: str) -> List[str]:
+        return self._dependents[stage_name]
+
+
+    def notify_exit(self, stage_name: str, return_code: int):
+        """
+        Report that a stage exited. Safe to call from any thread.
+        """
+        self._exits.put((stage_name, return_code, time.time()))
+
+
+    def _start_stage(self, stage_name: str):
+        try:
+            self.start_stage(stage_name)
+        except Exception as e:
+            print(f"Stage {stage_name} could not be started: {e}")
+            self.notify_exit(stage_name, -1)
+
+
+    def run(self) -> Dict[str, StageResult]:
+        """
+        Run all stages, respecting dependencies and the resource budget.
+
+        Returns:
+            Dict[str, StageResult]: The result of every stage that ran.
+
+        Raises:
+            Exception: If a stage exits with a non-zero exit code.
+        """
+        self._exits = queue.Queue()
+        # Stages are started in the order they were added, a stage becomes ready once its last dependency completed
+        order = {stage_name: index for index, stage_name in enumerate(self.dependencies)}
+        remaining = {stage_name: len(set(dependencies)) for stage_name, dependencies in self.dependencies.items()}
+        ready = [(order[stage_name], stage_name) for stage_name, count in remaining.items() if count == 0]
+        pending = len(self.dependencies)
+        running: Dict[str, float] = {}
+        used_resources = 0.0
+        failed_stage = None
+
+        with ThreadPoolExecutor(max_workers=max(1, len(self.dependencies))) as executor:
+            while pending or running:
+                if not failed_stage:
+                    for ready_stage in list(ready):
+                        stage_name = ready_stage[1]
+                        cost = self.stage_costs.get(stage_name, 1.0)
+                        fits_budget = self.resource_budget is None or used_resources + cost <= self.resource_budget
+                        if not fits_budget and running:
+                            continue
+
+                        print(f"Starting stage {stage_name}")
+                        ready.remove(ready_stage)
+                        pending -= 1
+                        running[stage_name] = time.time()
+                        used_resources += cost
+                        executor.submit(self._start_stage, stage_name)
+
+                if not running:
+                    break
+
+                stage_name, return_code, end_time = self._exits.get()
+                if stage_name not in running:
+                    continue
+
+                result = StageResult(stage_name=stage_name, return_code=return_code, start_time=running.pop(stage_name), end_time=end_time)
+                used_resources -= self.stage_costs.get(stage_name, 1.0)
+
+                if return_code in (0, None):
+                    print(f"Stage {stage_name} completed in {result.duration:.1f}s")
+                    self.results[stage_name] = result
+                    for dependent in self._dependents[stage_name]:
+                        remaining[dependent] -= 1
+                        if remaining[dependent] == 0:
+                            bisect.insort(ready, (order[dependent], dependent))
+                    continue
+
+                print(f"Stage {stage_name} failed with exit code {return_code}")
+                if not failed_stage:
+                    failed_stage = stage_name
+                    if self.stop_stage:
+                        for other_stage in running:
+                            print(f"Stopping stage {other_stage}")
+                            executor.submit(self.stop_stage, other_stage)
+
+        if failed_stage:
+            raise Exception(f"Error running the pipeline: stage {failed_stage} failed")
+
+        return self.results
+
+
+    def critical_path(self) -> Tuple[List[str], float]:
+        """
+        Get the chain of dependent stages with the longest total duration, which bounds the end-to-end time.
+
+        Returns:
+            Tuple[List[str], float]: The stage names on the critical path and their total duration in seconds.
+        """
+        # The longest total duration up to each stage and the previous stage on that chain
+        longest: Dict[str, Tuple[float, Optional[str]]] = {}
+
+        def visit(stage_name: str) -> float:
+            if stage_name not in longest:
+                duration = self.results[stage_name].duration if stage_name in self.results else 0.0
+                upstream = max(self.dependencies[stage_name], key=visit, default=None)
+                longest[stage_name] = ((visit(upstream) if upstream else 0.0) + duration, upstream)
+            return longest[stage_name][0]
+
+        if not self.dependencies:
+            return [], 0.0
+
+        stage_name = max(self.dependencies, key=visit)
+        total = longest[stage_name][0]
+        path = []
+        while stage_name:
+            path.append(stage_name)
+            stage_name = longest[stage_name][1]
+        return path[::-1], total
+
+
+    def report(self):
+        path, total = self.critical_path()
+        path_str = " -> ".join(f"{stage_name} ({self.results[stage_name].duration:.1f}s)" for stage_name in path if stage_name in self.results)
+        print(f"Critical path: {path_str} = {total:.1f}s")
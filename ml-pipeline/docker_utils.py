@@ -1,15 +1,31 @@
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple, Union
 from dataclasses import dataclass
+from functools import lru_cache
 import subprocess
-
+import hashlib
+import threading
+import shutil
+import re
 import os
-os.environ['PATH'] += ':/usr/local/bin' # I need to add this to the PATH to use docker-compose
 
 DOCKER_COMPOSE_FILE_NAME = "docker-compose.yml"
 
+BAKED_IMAGE_REPOSITORY = "docker-ml-learning/baked"
+
+REGISTRY_MIRROR_IMAGE = "registry:2"
+REGISTRY_MIRROR_CONTAINER_NAME = "docker-ml-learning-registry-mirror"
+DOCKER_HUB_REGISTRY_URL = "https://registry-1.docker.io"
+
+BAKED_IMAGE_DOCKERFILE_TEMPLATE = """
+FROM {base_image}
+COPY {requirements_file_name} /tmp/requirements.txt
+RUN pip install --no-cache-dir -r /tmp/requirements.txt
+"""
+
 DOCKER_COMPOSE_FILE_TEMPLATE = """
 services:
   {services}
+{volumes}
 """
 
 DOCKER_COMPOSE_SERVICE_TEMPLATE = """
@@ -28,6 +44,11 @@ DOCKER_COMPOSE_SERVICE_TEMPLATE = """
 {depends_on}
 {restart}
 {healthcheck}
+{cpus}
+{cpuset}
+{mem_limit}
+{shm_size}
+{ulimits}
 """
 
 @dataclass
@@ -42,6 +63,11 @@ class DependsOnService:
     services: Optional[str]
     condition: Optional[str]
 
+@dataclass
+class DockerComposeVolume:
+    name: str
+    driver_opts: Optional[Dict[str, str]] = None
+
 
 def format_list(items, indent=4):
         if not items:
@@ -54,6 +80,155 @@ def add_indent(text, indent=4):
 def remove_empty_lines(text):
     return "\n".join(line for line in text.split("\n") if line.strip())
 
+def get_docker_search_path() -> str:
+    # docker and docker-compose are not always on the PATH of a notebook kernel (e.g. when installed in
+    # /usr/local/bin), so that directory is searched as well
+    return os.pathsep.join([os.environ.get("PATH", ""), "/usr/local/bin"])
+
+@lru_cache(maxsize=None)
+def get_docker_command() -> List[str]:
+    """
+    Get the command to run the docker CLI with, resolved once like get_docker_compose_command.
+    """
+    return [shutil.which("docker", path=get_docker_search_path()) or "docker"]
+
+@lru_cache(maxsize=None)
+def get_docker_compose_command() -> List[str]:
+    """
+    Get the command to run docker compose with, resolved once instead of editing PATH at import time.
+
+    docker-compose is searched on the PATH and in /usr/local/bin before falling back to the `docker compose`
+    plugin of the docker CLI.
+    """
+    docker_compose = shutil.which("docker-compose", path=get_docker_search_path())
+    if docker_compose:
+        return [docker_compose]
+
+    return [*get_docker_command(), "compose"]
+
+def get_baked_image_tag(base_image: str, requirements_file: str, platform: Optional[str] = None) -> str:
+    """
+    Get the local image tag for a base image with a requirements file installed on top of it.
+
+    The tag is derived from the base image, the platform and the contents of the requirements file,
+    so editing the requirements file produces a new image while unchanged requirements reuse the cached one.
+    """
+    digest = hashlib.sha256()
+    digest.update(base_image.encode())
+    digest.update(b"\0" + (platform or "").encode())
+    with open(requirements_file, "rb") as f:
+        digest.update(b"\0" + f.read())
+
+    base_name = re.sub(r"[^A-Za-z0-9_.-]", "-", base_image)[:100]
+    return f"{BAKED_IMAGE_REPOSITORY}:{base_name}-{digest.hexdigest()[:12]}"
+
+def image_exists(image: str) -> bool:
+    process = subprocess.run([*get_docker_command(), "image", "inspect", image], capture_output=True, text=True)
+    return process.returncode == 0
+
+def get_image_id(image: str) -> Optional[str]:
+    process = subprocess.run([*get_docker_command(), "image", "inspect", "--format", "{{.Id}}", image], capture_output=True, text=True)
+    if process.returncode != 0:
+        return None
+    return process.stdout.strip()
+
+def get_mirror_image(image: str, registry_mirror: str) -> Optional[str]:
+    """
+    Get the name of a Docker Hub image in a pull-through registry mirror, e.g. "python:3.9" in "localhost:5000"
+    is "localhost:5000/library/python:3.9".
+
+    Returns:
+        Optional[str]: The mirrored image name, or None if the image is not on Docker Hub and so not mirrored.
+    """
+    first_component, _, rest = image.partition("/")
+    if rest and ("." in first_component or ":" in first_component or first_component == "localhost"):
+        # The image names its own registry
+        if first_component not in ("docker.io", "index.docker.io"):
+            return None
+        image = rest
+
+    if "/" not in image:
+        image = f"library/{image}"
+
+    return f"{registry_mirror.rstrip('/')}/{image}"
+
+def start_registry_mirror(
+    port: int = 5000,
+    remote_url: str = DOCKER_HUB_REGISTRY_URL,
+    data_dir: Optional[str] = None,
+    container_name: str = REGISTRY_MIRROR_CONTAINER_NAME
+) -> str:
+    """
+    Start (or reuse) a local pull-through cache of a remote registry in a `registry:2` container.
+
+    Images pulled through it are stored locally, so later pulls on this host (e.g. after `docker image prune`
+    or from other Docker contexts) do not go to the remote registry again.
+
+    Args:
+        port (int): The host port to publish the mirror on.
+        remote_url (str): The URL of the registry to mirror. Defaults to Docker Hub.
+        data_dir (Optional[str]): A host directory to store the cached images in, so they survive the container.
+        container_name (str): The name of the mirror container.
+
+    Returns:
+        str: The address of the mirror, e.g. "localhost:5000", to pass as `registry_mirror`.
+    """
+    process = subprocess.run([*get_docker_command(), "inspect", "--format", "{{.State.Running}}", container_name], capture_output=True, text=True)
+    if process.returncode == 0:
+        if process.stdout.strip() != "true":
+            subprocess.run([*get_docker_command(), "start", container_name], capture_output=True, text=True, check=True)
+        print(f"Using registry mirror {container_name} on localhost:{port}")
+        return f"localhost:{port}"
+
+    command = [
+        *get_docker_command(), "run", "-d", "--name", container_name, "--restart", "unless-stopped",
+        "-p", f"{port}:5000", "-e", f"REGISTRY_PROXY_REMOTEURL={remote_url}"
+    ]
+    if data_dir:
+        command.extend(["-v", f"{os.path.abspath(data_dir)}:/var/lib/registry"])
+    command.append(REGISTRY_MIRROR_IMAGE)
+
+    print(f"Running command: {command}")
+    process = subprocess.run(command, capture_output=True, text=True)
+    if process.returncode != 0:
+        raise Exception(f"Error starting registry mirror: {process.stderr.strip()}")
+
+    return f"localhost:{port}"
+
+def build_dependency_image(base_image: str, requirements_file: str, platform: Optional[str] = None) -> str:
+    """
+    Build (or reuse) an image with the requirements file installed on top of the base image.
+
+    Args:
+        base_image (str): The URI of the base Docker image.
+        requirements_file (str): The host path to the requirements file.
+        platform (Optional[str]): The platform to build the image for.
+
+    Returns:
+        str: The tag of the image with the requirements installed.
+    """
+    tag = get_baked_image_tag(base_image, requirements_file, platform)
+    if image_exists(tag):
+        print(f"Using cached dependency image {tag}")
+        return tag
+
+    dockerfile = BAKED_IMAGE_DOCKERFILE_TEMPLATE.format(
+        base_image=base_image,
+        requirements_file_name=os.path.basename(requirements_file)
+    )
+
+    command = [*get_docker_command(), "build", "-t", tag, "-f", "-"]
+    if platform:
+        command.extend(["--platform", platform])
+    command.append(os.path.dirname(os.path.abspath(requirements_file)))
+
+    print(f"Running command: {command}")
+    process = subprocess.run(command, input=dockerfile, capture_output=True, text=True)
+    if process.returncode != 0:
+        raise Exception(f"Error building dependency image {tag}: {process.stderr.strip()}")
+
+    return tag
+
 def format_healthcheck(health_check: HealthCheck):
     if not health_check:
         return ""
@@ -66,6 +241,65 @@ def format_healthcheck(health_check: HealthCheck):
     
     return healthcheck_str
 
+def format_ulimits(ulimits: Optional[Dict[str, Union[int, Tuple[int, int]]]]):
+    if not ulimits:
+        return ""
+
+    ulimits_str = "  ulimits:\n"
+    for name, limit in ulimits.items():
+        if isinstance(limit, (tuple, list)):
+            ulimits_str += f"    {name}:\n"
+            ulimits_str += f"      soft: {limit[0]}\n"
+            ulimits_str += f"      hard: {limit[1]}\n"
+        else:
+            ulimits_str += f"    {name}: {limit}\n"
+
+    return ulimits_str
+
+def parse_size(size: Union[str, int]) -> int:
+    """
+    Convert a Docker size string (e.g. "512m", "2g", "1gb") to a number of bytes.
+    """
+    if isinstance(size, int):
+        return size
+
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([kmgt]?)b?\s*", size.lower())
+    if not match:
+        raise ValueError(f"Invalid size: {size}")
+
+    value, unit = match.groups()
+    return int(float(value) * 1024 ** " kmgt".index(unit or " "))
+
+def format_volumes(volumes: List[DockerComposeVolume]):
+    if not volumes:
+        return ""
+
+    # The explicit name keeps docker-compose from prefixing it with the project name
+    volumes_str = "volumes:\n"
+    for volume in volumes:
+        volumes_str += f"  {volume.name}:\n"
+        volumes_str += f"    name: {volume.name}\n"
+        if volume.driver_opts:
+            volumes_str += "    driver_opts:\n"
+            for key, value in volume.driver_opts.items():
+                volumes_str += f"      {key}: \"{value}\"\n"
+
+    return volumes_str
+
+def parse_duration(duration: Union[str, int, float]) -> float:
+    """
+    Convert a Docker Compose duration string (e.g. "30s", "1m30s", "500ms") to a number of seconds.
+    """
+    if isinstance(duration, (int, float)):
+        return float(duration)
+
+    units = {"h": 3600, "m": 60, "s": 1, "ms": 0.001, "us": 0.000001}
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|us|h|m|s)", duration.strip())
+    if not parts or "".join(value + unit for value, unit in parts) != duration.strip():
+        raise ValueError(f"Invalid duration: {duration}")
+
+    return sum(float(value) * units[unit] for value, unit in parts)
+
 def format_depends_on(dependent_services: List[DependsOnService]):
     if not dependent_services:
         return ""
@@ -98,6 +332,15 @@ class DockerComposeService:
             restart: Optional[str] = None,
             health_check: Optional[HealthCheck] = None,
             detach_on_build: Optional[bool] = False,
+            requirements_file: Optional[str] = None,
+            cpu_request: Optional[float] = 1.0,
+            inputs: Optional[List[str]] = None,
+            outputs: Optional[List[str]] = None,
+            cpus: Optional[float] = None,
+            cpuset: Optional[str] = None,
+            mem_limit: Optional[str] = None,
+            shm_size: Optional[str] = None,
+            ulimits: Optional[Dict[str, Union[int, Tuple[int, int]]]] = None,
     ):
         self.service_name = service_name
         self.image = image
@@ -115,6 +358,15 @@ class DockerComposeService:
         self.restart = restart
         self.health_check = health_check
         self.detach_on_build = detach_on_build
+        self.requirements_file = requirements_file
+        self.cpu_request = cpu_request
+        self.inputs = inputs
+        self.outputs = outputs
+        self.cpus = cpus
+        self.cpuset = cpuset
+        self.mem_limit = mem_limit
+        self.shm_size = shm_size
+        self.ulimits = ulimits
 
 
     def to_dict(self):
@@ -132,7 +384,12 @@ class DockerComposeService:
             "networks": self.networks,
             "depends_on": self.depends_on,
             "restart": self.restart,
-            "healthcheck": None
+            "healthcheck": None,
+            "cpus": self.cpus,
+            "cpuset": self.cpuset,
+            "mem_limit": self.mem_limit,
+            "shm_size": self.shm_size,
+            "ulimits": self.ulimits
         }
         if self.health_check:
             service_dict["healthcheck"] = {
@@ -159,6 +416,11 @@ class DockerComposeService:
         formatted_depends_on = format_depends_on(self.depends_on)
         formatted_restart = f"  restart: {self.restart}" if self.restart else ""
         formatted_healthcheck = format_healthcheck(self.health_check)
+        formatted_cpus = f"  cpus: {self.cpus}" if self.cpus else ""
+        formatted_cpuset = f"  cpuset: \"{self.cpuset}\"" if self.cpuset else ""
+        formatted_mem_limit = f"  mem_limit: {self.mem_limit}" if self.mem_limit else ""
+        formatted_shm_size = f"  shm_size: {self.shm_size}" if self.shm_size else ""
+        formatted_ulimits = format_ulimits(self.ulimits)
 
         return DOCKER_COMPOSE_SERVICE_TEMPLATE.format(
             service_name=self.service_name,
@@ -175,33 +437,67 @@ class DockerComposeService:
             networks=formatted_networks,
             depends_on=formatted_depends_on,
             restart=formatted_restart,
-            healthcheck=formatted_healthcheck
+            healthcheck=formatted_healthcheck,
+            cpus=formatted_cpus,
+            cpuset=formatted_cpuset,
+            mem_limit=formatted_mem_limit,
+            shm_size=formatted_shm_size,
+            ulimits=formatted_ulimits
         )
 
 
 class DockerComposeClient:
-    def __init__(self, services: List[DockerComposeService]):
+    def __init__(self, services: List[DockerComposeService], volumes: Optional[List[DockerComposeVolume]] = None):
         self.services = services
+        self.volumes = volumes if volumes is not None else []
+        self._written_files = {}
+        self._service_index = {service.service_name: index for index, service in enumerate(services)}
 
 
     def add_service(self, service: DockerComposeService):
+        self._service_index[service.service_name] = len(self.services)
         self.services.append(service)
 
 
+    def get_service(self, service_name: str) -> Optional[DockerComposeService]:
+        """
+        Get a service by name without scanning all services. The name index is rebuilt when `services` was
+        changed other than through `add_service`.
+        """
+        index = self._service_index.get(service_name)
+        if index is None and len(self._service_index) == len(self.services):
+            return None
+        if index is None or index >= len(self.services) or self.services[index].service_name != service_name:
+            self._service_index = {service.service_name: index for index, service in enumerate(self.services)}
+            index = self._service_index.get(service_name)
+        return None if index is None else self.services[index]
+
+
+    def add_volume(self, volume: DockerComposeVolume):
+        self.volumes = [existing for existing in self.volumes if existing.name != volume.name] + [volume]
+
+
     def create_compose_file(self, file_name: str = DOCKER_COMPOSE_FILE_NAME):
-        with open(file_name, "w") as f:
-            yaml_str = self.to_yaml()
-            print(f"Writing Docker Compose file:\n{yaml_str}")
+        yaml_str = self.to_yaml()
+
+        # Skip rewriting the file when it still has the content we last wrote to it
+        if self._written_files.get(file_name) == yaml_str and os.path.exists(file_name):
+            return
+
+        # Write to a temporary file first so a concurrently starting docker-compose never reads a partial file
+        print(f"Writing Docker Compose file:\n{yaml_str}")
+        temp_file_name = f"{file_name}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_file_name, "w") as f:
             f.write(yaml_str)
+        os.replace(temp_file_name, file_name)
+        self._written_files[file_name] = yaml_str
 
 
     def to_yaml(self):
 
-        services = ""
-        for service in self.services:
-            services += add_indent(service.to_yaml(), 2)
+        services = "".join(add_indent(service.to_yaml(), 2) for service in self.services)
 
-        compose_file = DOCKER_COMPOSE_FILE_TEMPLATE.format(services=services)
+        compose_file = DOCKER_COMPOSE_FILE_TEMPLATE.format(services=services, volumes=format_volumes(self.volumes))
 
         return remove_empty_lines(compose_file)
 
@@ -209,7 +505,7 @@ class DockerComposeClient:
     def compose_up(self, compose_file: str = DOCKER_COMPOSE_FILE_NAME, args: str = "", services: List[str] = []):
         self.create_compose_file()
 
-        command = ["docker-compose", "-f", compose_file, "up"]
+        command = [*get_docker_compose_command(), "-f", compose_file, "up"]
         if args:
             command.extend(args.split())
         if services:
@@ -225,7 +521,7 @@ class DockerComposeClient:
 
 
     def compose_down(self, compose_file: str = DOCKER_COMPOSE_FILE_NAME, args: str = "", services: List[str] = []):
-        command = ["docker-compose", "-f", compose_file, "down"]
+        command = [*get_docker_compose_command(), "-f", compose_file, "down"]
         if args:
             command.extend(args.split())
         if services:
@@ -240,9 +536,48 @@ class DockerComposeClient:
             return process.returncode
 
 
+    def run_service(self, service: str, compose_file: str = DOCKER_COMPOSE_FILE_NAME, args: str = "", detach: bool = False) -> int:
+        """
+        Start a single service without its dependencies and wait until it exits (or until it started when detached).
+
+        The output is printed in real-time, prefixed with the service name by docker-compose.
+
+        Returns:
+            int: The exit code of the service (or of docker-compose when detached).
+        """
+        command = [*get_docker_compose_command(), "-f", compose_file, "up", "--no-deps"]
+        if args:
+            command.extend(args.split())
+        if detach:
+            command.append("--detach")
+        else:
+            command.extend(["--exit-code-from", service])
+        command.append(service)
+
+        print(f"Running command: {command}")
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        for line in process.stdout:
+            print(line.rstrip())
+
+        return process.wait()
+
+
+    def stop_services(self, compose_file: str = DOCKER_COMPOSE_FILE_NAME, services: List[str] = []):
+        command = [*get_docker_compose_command(), "-f", compose_file, "stop"]
+        if services:
+            command.extend(services)
+
+        print(f"Running command: {command}")
+        process = subprocess.run(command, capture_output=True, text=True)
+
+        if process.returncode != 0:
+            print(f"Error: {process.stderr.strip()}")
+            return process.returncode
+
+
     def follow_logs(self, compose_file: str = DOCKER_COMPOSE_FILE_NAME, services: List[str] = []):
          # Follow the logs
-        log_command = ["docker-compose", "-f", compose_file, "logs", "-f"]
+        log_command = [*get_docker_compose_command(), "-f", compose_file, "logs", "-f"]
         if services:
             log_command.extend(services)
         print(f"Running command: {log_command}")
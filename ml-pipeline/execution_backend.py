@@ -0,0 +1,714 @@
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from dataclasses import dataclass, field
+from urllib.parse import quote, urlencode
+import hashlib
+import http.client
+import json
+import os
+import shlex
+import socket
+import struct
+import subprocess
+import threading
+import time
+
+from docker_utils import (
+    DOCKER_COMPOSE_FILE_NAME,
+    DockerComposeClient,
+    DockerComposeService,
+    DockerComposeVolume,
+    build_dependency_image,
+    get_docker_command,
+    get_docker_compose_command,
+    get_image_id,
+    parse_duration,
+    parse_size,
+)
+
+DOCKER_SOCKET_PATH = "/var/run/docker.sock"
+DOCKER_API_VERSION = "v1.41"
+PIPELINE_LABEL = "com.docker-ml-learning.pipeline"
+STAGE_LABEL = "com.docker-ml-learning.stage"
+
+
+class ExecutionBackend:
+    """
+    ExecutionBackend class that runs the stages of a pipeline.
+
+    `run_stage` starts a stage and, unless it is detached, waits for it to exit. Backends implement the
+    individual steps (start, wait, stop, logs) so the pipeline runner can drive them directly.
+    """
+
+    def prepare(self, services: List[DockerComposeService], volumes: Optional[List[DockerComposeVolume]] = None):
+        """
+        Called once before any stage of the pipeline is started, with the named volumes the stages mount.
+        """
+        pass
+
+
+    def start_stage(self, service: DockerComposeService) -> str:
+        """
+        Start the stage without waiting for it and return the ID of its container.
+        """
+        raise NotImplementedError
+
+
+    def wait_stage(self, service_name: str) -> int:
+        """
+        Wait for a started stage to exit and return its exit code.
+        """
+        raise NotImplementedError
+
+
+    def stop_stage(self, service_name: str):
+        raise NotImplementedError
+
+
+    def stage_logs(self, service_name: str, follow: bool = True) -> Iterator[str]:
+        """
+        Get the stdout and stderr lines of a started stage, following them until it exits if `follow` is set.
+        """
+        raise NotImplementedError
+
+
+    def run_stage(self, service: DockerComposeService, detach: bool = False) -> int:
+        self.start_stage(service)
+        if detach:
+            return 0
+        return self.wait_stage(service.service_name)
+
+
+    def watch_exits(self, on_exit: Callable[[str, int], None]):
+        """
+        Call `on_exit(stage_name, exit_code)` whenever a stage passed to `track_exit` exits.
+        """
+        self._on_exit = on_exit
+
+
+    def track_exit(self, service_name: str):
+        """
+        Report the exit of a started stage to the `watch_exits` callback. By default a thread waits for it.
+        """
+        def wait():
+            try:
+                return_code = self.wait_stage(service_name)
+            except Exception as e:
+                print(f"Error waiting for stage {service_name}: {e}")
+                return_code = -1
+            self._on_exit(service_name, return_code)
+
+        threading.Thread(target=wait, name=f"wait-{service_name}", daemon=True).start()
+
+
+    def stage_stats(self, service_name: str) -> Optional[Tuple[float, int]]:
+        """
+        Get the CPU usage (percent of one core) and memory usage (bytes) of a running stage, if available.
+        """
+        return None
+
+
+    def stage_health(self, service_name: str) -> Optional[str]:
+        """
+        Get the health check status ("starting", "healthy" or "unhealthy") of a running stage, or None if it
+        has no health check.
+        """
+        return None
+
+
+    def follow_logs(self, services: List[str]) -> int:
+        for service_name in services:
+            for line in self.stage_logs(service_name):
+                print(f"{service_name} | {line}")
+        return 0
+
+
+    def image_id(self, image: str) -> Optional[str]:
+        raise NotImplementedError
+
+
+    def pull_image(self, image: str):
+        raise NotImplementedError
+
+
+    def tag_image(self, image: str, tag: str):
+        raise NotImplementedError
+
+
+    def build_dependency_image(self, base_image: str, requirements_file: str, platform: Optional[str] = None) -> str:
+        return build_dependency_image(base_image=base_image, requirements_file=requirements_file, platform=platform)
+
+
+    def close(self):
+        pass
+
+
+class ComposeBackend(ExecutionBackend):
+    def __init__(self, compose_client: DockerComposeClient, compose_file: str = DOCKER_COMPOSE_FILE_NAME):
+        """
+        ComposeBackend class to run stages with the docker-compose CLI.
+
+        The compose file is written in `prepare` and only rewritten when a stage's settings changed since (e.g. a 
+        cpuset assigned when it starts). Every stage is started with `docker-compose up --no-deps`.
+
+        Attributes:
+            compose_client (DockerComposeClient): The client of the pipeline's compose file.
+            compose_file (str): The path to write the compose file to.
+            containers (Dict[str, str]): The container ID of every started stage, by stage name.
+        """
+        self.compose_client = compose_client
+        self.compose_file = compose_file
+        self.containers: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+
+    def prepare(self, services: List[DockerComposeService], volumes: Optional[List[DockerComposeVolume]] = None):
+        # The volumes are declared in the compose file and created by docker-compose
+        self.compose_client.create_compose_file(self.compose_file)
+
+
+    def _update_compose_file(self):
+        # Settings assigned when a stage starts (e.g. its cpuset) need to be in the file compose reads
+        with self._lock:
+            self.compose_client.create_compose_file(self.compose_file)
+
+
+    def _container_id(self, service_name: str) -> str:
+        if service_name in self.containers:
+            return self.containers[service_name]
+
+        # -a, as `ps -q` only lists running containers and a short stage may have exited already
+        command = [*get_docker_compose_command(), "-f", self.compose_file, "ps", "-a", "-q", service_name]
+        container_id = subprocess.run(command, capture_output=True, text=True).stdout.strip()
+        if not container_id:
+            raise Exception(f"No container found for stage {service_name}")
+        return container_id
+
+
+    def run_stage(self, service: DockerComposeService, detach: bool = False) -> int:
+        self._update_compose_file()
+        return self.compose_client.run_service(service.service_name, compose_file=self.compose_file, args="--build", detach=detach)
+
+
+    def start_stage(self, service: DockerComposeService) -> str:
+        self._update_compose_file()
+        self.compose_client.run_service(service.service_name, compose_file=self.compose_file, args="--build", detach=True)
+        # Resolved now, while the container of this run is the service's only one
+        self.containers.pop(service.service_name, None)
+        container_id = self._container_id(service.service_name)
+        self.containers[service.service_name] = container_id
+        return container_id
+
+
+    def wait_stage(self, service_name: str) -> int:
+        process = subprocess.run([*get_docker_command(), "wait", self._container_id(service_name)], capture_output=True, text=True)
+        if process.returncode != 0:
+            return process.returncode
+        return int(process.stdout.strip())
+
+
+    def stop_stage(self, service_name: str):
+        self.compose_client.stop_services(compose_file=self.compose_file, services=[service_name])
+
+
+    def stage_logs(self, service_name: str, follow: bool = True) -> Iterator[str]:
+        command = [*get_docker_compose_command(), "-f", self.compose_file, "logs", "--no-log-prefix"]
+        if follow:
+            command.append("-f")
+        command.append(service_name)
+
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        for line in process.stdout:
+            yield line.rstrip("\n")
+        process.wait()
+
+
+    def stage_stats(self, service_name: str) -> Optional[Tuple[float, int]]:
+        command = [*get_docker_command(), "stats", "--no-stream", "--format", "{{.CPUPerc}}|{{.MemUsage}}", self._container_id(service_name)]
+        process = subprocess.run(command, capture_output=True, text=True)
+        if process.returncode != 0 or "|" not in process.stdout:
+            return None
+
+        # e.g. "12.34%|100.5MiB / 1.944GiB"
+        cpu, memory = process.stdout.strip().split("|", 1)
+        memory = memory.split("/")[0].strip().replace("i", "")
+        return float(cpu.rstrip("%")), parse_size(memory)
+
+
+    def stage_health(self, service_name: str) -> Optional[str]:
+        command = [*get_docker_command(), "inspect", "--format", "{{if .State.Health}}{{.State.Health.Status}}{{end}}", self._container_id(service_name)]
+        process = subprocess.run(command, capture_output=True, text=True)
+        if process.returncode != 0:
+            raise Exception(f"Error inspecting stage {service_name}: {process.stderr.strip()}")
+        return process.stdout.strip() or None
+
+
+    def follow_logs(self, services: List[str]) -> int:
+        return self.compose_client.follow_logs(compose_file=self.compose_file, services=services)
+
+
+    def image_id(self, image: str) -> Optional[str]:
+        return get_image_id(image)
+
+
+    def pull_image(self, image: str):
+        process = subprocess.run([*get_docker_command(), "pull", image], capture_output=True, text=True)
+        if process.returncode != 0:
+            raise Exception(f"Error pulling image {image}: {process.stderr.strip()}")
+
+
+    def tag_image(self, image: str, tag: str):
+        process = subprocess.run([*get_docker_command(), "tag", image, tag], capture_output=True, text=True)
+        if process.returncode != 0:
+            raise Exception(f"Error tagging image {image} as {tag}: {process.stderr.strip()}")
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, timeout: Optional[float] = None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class DockerEngineBackend(ExecutionBackend):
+    def __init__(self, project_name: Optional[str] = None, socket_path: str = DOCKER_SOCKET_PATH, api_version: str = DOCKER_API_VERSION):
+        """
+        DockerEngineBackend class to run stages through the Docker Engine API on the local socket.
+
+        Requests reuse one keep-alive connection per thread instead of spawning a CLI process per operation.
+        Blocking calls (wait, log streams) get their own connection so they do not hold up other requests.
+        Containers are attached to a "<project_name>_default" network with their stage name as alias, so
+        stages can reach each other by name like they can with docker-compose.
+
+        Attributes:
+            project_name (str): The name used to label and prefix the pipeline's containers and network.
+                Defaults to the name of the current directory.
+            socket_path (str): The path of the Docker Engine socket.
+            api_version (str): The Docker Engine API version to use.
+        """
+        self.project_name = project_name or os.path.basename(os.getcwd())
+        self.socket_path = socket_path
+        self.api_version = api_version
+        self.network_name = f"{self.project_name}_default"
+        self.containers: Dict[str, str] = {}
+        self._local = threading.local()
+        self._events_connection = None
+
+
+    def _connection(self) -> UnixHTTPConnection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = UnixHTTPConnection(self.socket_path)
+            self._local.connection = connection
+        return connection
+
+
+    def _url(self, path: str, params: Optional[dict] = None) -> str:
+        url = f"/{self.api_version}{path}"
+        if params:
+            url += "?" + urlencode(params)
+        return url
+
+
+    def _request(self, method: str, path: str, params: Optional[dict] = None, body: Optional[dict] = None, expected: tuple = (200, 201, 204)):
+        payload = json.dumps(body) if body is not None else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+
+        for attempt in range(2):
+            connection = self._connection()
+            try:
+                connection.request(method, self._url(path, params), body=payload, headers=headers)
+                response = connection.getresponse()
+                data = response.read()
+                break
+            except (http.client.HTTPException, ConnectionError):
+                # The daemon closed the keep-alive connection, reconnect once
+                connection.close()
+                self._local.connection = None
+                if attempt:
+                    raise
+
+        if response.status not in expected:
+            raise Exception(f"Docker Engine API error {response.status} for {method} {path}: {data.decode(errors='replace').strip()}")
+
+        return response.status, json.loads(data) if data else None
+
+
+    def _stream(self, method: str, path: str, params: Optional[dict] = None, connection: Optional[UnixHTTPConnection] = None) -> Tuple[UnixHTTPConnection, http.client.HTTPResponse]:
+        """
+        Send a request whose response is read incrementally, on its own connection (a new one by default) since the
+        response may not end for a long time. The caller closes the connection once done with the response.
+        """
+        connection = connection or UnixHTTPConnection(self.socket_path)
+        try:
+            connection.request(method, self._url(path, params))
+            response = connection.getresponse()
+        except BaseException:
+            connection.close()
+            raise
+        if response.status != 200:
+            data = response.read()
+            connection.close()
+            raise Exception(f"Docker Engine API error {response.status} for {method} {path}: {data.decode(errors='replace').strip()}")
+        return connection, response
+
+
+    def _container_name(self, service_name: str) -> str:
+        return f"{self.project_name}-{service_name}"
+
+
+    def _create_body(self, service: DockerComposeService) -> dict:
+        body = {
+            "Image": service.image,
+            "Labels": {PIPELINE_LABEL: self.project_name, STAGE_LABEL: service.service_name},
+            "Env": service.environment or [],
+            "HostConfig": {"Binds": [os.path.expanduser(volume) for volume in service.volumes or []]},
+            "NetworkingConfig": {"EndpointsConfig": {self.network_name: {"Aliases": [service.service_name]}}},
+        }
+        if service.entrypoint:
+            body["Entrypoint"] = shlex.split(service.entrypoint)
+        if service.command:
+            body["Cmd"] = shlex.split(service.command)
+        if service.working_dir:
+            body["WorkingDir"] = service.working_dir
+        if service.platform:
+            body["Platform"] = service.platform
+        if service.restart:
+            body["HostConfig"]["RestartPolicy"] = {"Name": service.restart}
+        if service.ports:
+            body["ExposedPorts"] = {}
+            body["HostConfig"]["PortBindings"] = {}
+            for port in service.ports:
+                host_port, _, container_port = str(port).rpartition(":")
+                container_port = container_port if "/" in container_port else f"{container_port}/tcp"
+                body["ExposedPorts"][container_port] = {}
+                body["HostConfig"]["PortBindings"][container_port] = [{"HostPort": host_port.rpartition(":")[2]}]
+        if service.cpus:
+            body["HostConfig"]["NanoCpus"] = int(float(service.cpus) * 1e9)
+        if service.cpuset:
+            body["HostConfig"]["CpusetCpus"] = service.cpuset
+        if service.mem_limit:
+            body["HostConfig"]["Memory"] = parse_size(service.mem_limit)
+        if service.shm_size:
+            body["HostConfig"]["ShmSize"] = parse_size(service.shm_size)
+        if service.ulimits:
+            body["HostConfig"]["Ulimits"] = [
+                {"Name": name, "Soft": limit[0], "Hard": limit[1]} if isinstance(limit, (tuple, list)) else {"Name": name, "Soft": limit, "Hard": limit}
+                for name, limit in service.ulimits.items()
+            ]
+        if service.health_check:
+            body["Healthcheck"] = {
+                "Test": ["CMD-SHELL", service.health_check.test],
+                "Retries": service.health_check.retries or 0,
+            }
+            if service.health_check.interval:
+                body["Healthcheck"]["Interval"] = int(parse_duration(service.health_check.interval) * 1e9)
+            if service.health_check.timeout:
+                body["Healthcheck"]["Timeout"] = int(parse_duration(service.health_check.timeout) * 1e9)
+        return body
+
+
+    def prepare(self, services: List[DockerComposeService], volumes: Optional[List[DockerComposeVolume]] = None):
+        self._request("POST", "/networks/create", body={"Name": self.network_name, "CheckDuplicate": True}, expected=(201, 409))
+        for volume in volumes or []:
+            body = {"Name": volume.name, "Labels": {PIPELINE_LABEL: self.project_name}}
+            if volume.driver_opts:
+                body["DriverOpts"] = volume.driver_opts
+            self._request("POST", "/volumes/create", body=body, expected=(201,))
+
+
+    def start_stage(self, service: DockerComposeService) -> str:
+        name = self._container_name(service.service_name)
+        body = self._create_body(service)
+
+        status, response = self._request("POST", "/containers/create", params={"name": name}, body=body, expected=(201, 409))
+        if status == 409:
+            # A container from a previous run still exists
+            self._request("DELETE", f"/containers/{quote(name)}", params={"force": "true"}, expected=(204, 404))
+            status, response = self._request("POST", "/containers/create", params={"name": name}, body=body)
+
+        container_id = response["Id"]
+        # Recorded before starting, so the events reader knows the ID when a short stage dies right away
+        self.containers[service.service_name] = container_id
+        self._request("POST", f"/containers/{container_id}/start", expected=(204, 304))
+        return container_id
+
+
+    def watch_exits(self, on_exit: Callable[[str, int], None]):
+        """
+        Follow the daemon's "die" events for this pipeline's containers on a single connection, replacing the
+        previous watcher. Events of containers other than a stage's current one (e.g. the previous run's container
+        removed in `start_stage`) are ignored.
+        """
+        self._close_events()
+        filters = {"type": ["container"], "event": ["die"], "label": [f"{PIPELINE_LABEL}={self.project_name}"]}
+        self._events_connection = UnixHTTPConnection(self.socket_path)
+        _, events = self._stream("GET", "/events", params={"filters": json.dumps(filters)}, connection=self._events_connection)
+
+        def read_events(events: http.client.HTTPResponse):
+            try:
+                for line in events:
+                    if not line.strip():
+                        continue
+                    actor = json.loads(line)["Actor"]
+                    stage_name = actor["Attributes"][STAGE_LABEL]
+                    if actor["ID"] != self.containers.get(stage_name):
+                        continue
+                    on_exit(stage_name, int(actor["Attributes"].get("exitCode", -1)))
+            except (OSError, ValueError, http.client.HTTPException):
+                # The connection is shut down by close()
+                pass
+
+        threading.Thread(target=read_events, args=(events,), name="docker-events", daemon=True).start()
+
+
+    def track_exit(self, service_name: str):
+        # Exits are already reported by the events stream
+        pass
+
+
+    def wait_stage(self, service_name: str) -> int:
+        connection, response = self._stream("POST", f"/containers/{self.containers[service_name]}/wait")
+        try:
+            result = json.loads(response.read())
+        finally:
+            response.close()
+            connection.close()
+        return result["StatusCode"]
+
+
+    def stop_stage(self, service_name: str):
+        if service_name in self.containers:
+            self._request("POST", f"/containers/{self.containers[service_name]}/stop", params={"t": 10}, expected=(204, 304, 404))
+
+
+    def stage_logs(self, service_name: str, follow: bool = True) -> Iterator[str]:
+        params = {"stdout": 1, "stderr": 1, "follow": 1 if follow else 0}
+        connection, response = self._stream("GET", f"/containers/{self.containers[service_name]}/logs", params=params)
+
+        # Closed in finally, also when the caller stops iterating early (the generator is closed)
+        try:
+            # Without a TTY the stream is multiplexed: an 8 byte header (stream type, 3 padding bytes,
+            # big-endian payload size) in front of every frame
+            buffer = b""
+            while True:
+                header = response.read(8)
+                if len(header) < 8:
+                    break
+                _, size = struct.unpack(">BxxxL", header)
+                buffer += response.read(size)
+                *lines, buffer = buffer.split(b"\n")
+                for line in lines:
+                    yield line.decode(errors="replace")
+
+            if buffer:
+                yield buffer.decode(errors="replace")
+        finally:
+            response.close()
+            connection.close()
+
+
+    def stage_stats(self, service_name: str) -> Optional[Tuple[float, int]]:
+        if service_name not in self.containers:
+            return None
+        status, stats = self._request("GET", f"/containers/{self.containers[service_name]}/stats", params={"stream": "false"}, expected=(200, 404, 409))
+        if status != 200 or not stats.get("memory_stats"):
+            return None
+
+        cpu_stats = stats["cpu_stats"]
+        precpu_stats = stats.get("precpu_stats", {})
+        cpu_delta = cpu_stats["cpu_usage"]["total_usage"] - precpu_stats.get("cpu_usage", {}).get("total_usage", 0)
+        system_delta = cpu_stats.get("system_cpu_usage", 0) - precpu_stats.get("system_cpu_usage", 0)
+        online_cpus = cpu_stats.get("online_cpus") or len(cpu_stats["cpu_usage"].get("percpu_usage") or [1])
+        cpu_percent = cpu_delta / system_delta * online_cpus * 100.0 if system_delta > 0 else 0.0
+
+        # Page cache is not counted, like `docker stats` does
+        memory_stats = stats["memory_stats"]
+        memory = memory_stats.get("usage", 0) - memory_stats.get("stats", {}).get("inactive_file", 0)
+        return cpu_percent, memory
+
+
+    def stage_health(self, service_name: str) -> Optional[str]:
+        _, container = self._request("GET", f"/containers/{self.containers[service_name]}/json")
+        health = container["State"].get("Health")
+        return health["Status"] if health else None
+
+
+    def remove_stage(self, service_name: str):
+        container_id = self.containers.pop(service_name, None)
+        if container_id:
+            self._request("DELETE", f"/containers/{container_id}", params={"force": "true"}, expected=(204, 404))
+
+
+    def image_id(self, image: str) -> Optional[str]:
+        status, response = self._request("GET", f"/images/{quote(image, safe='')}/json", expected=(200, 404))
+        if status == 404:
+            return None
+        return response["Id"]
+
+
+    @staticmethod
+    def _split_tag(image: str) -> Tuple[str, str]:
+        name, _, tag = image.rpartition(":") if ":" in image.rsplit("/", 1)[-1] else (image, "", "latest")
+        return name, tag
+
+
+    def pull_image(self, image: str):
+        name, tag = self._split_tag(image)
+        connection, response = self._stream("POST", "/images/create", params={"fromImage": name, "tag": tag})
+
+        # Progress is streamed as JSON lines, errors are reported in-stream with a 200 status
+        try:
+            for line in response:
+                message = json.loads(line)
+                if "error" in message:
+                    raise Exception(f"Error pulling image {image}: {message['error']}")
+        finally:
+            response.close()
+            connection.close()
+
+
+    def tag_image(self, image: str, tag: str):
+        repository, tag = self._split_tag(tag)
+        self._request("POST", f"/images/{quote(image, safe='')}/tag", params={"repo": repository, "tag": tag}, expected=(201,))
+
+
+    def _close_events(self):
+        if self._events_connection is not None:
+            if self._events_connection.sock is not None:
+                self._events_connection.sock.shutdown(socket.SHUT_RDWR)
+            self._events_connection.close()
+            self._events_connection = None
+
+
+    def close(self):
+        self._close_events()
+
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+@dataclass
+class FakeContainer:
+    service: DockerComposeService
+    start_time: float
+    duration: float
+    exit_code: int
+    logs: List[str] = field(default_factory=list)
+    stopped: threading.Event = field(default_factory=threading.Event)
+
+
+class FakeBackend(ExecutionBackend):
+    def __init__(
+            self,
+            durations: Optional[Dict[str, float]] = None,
+            exit_codes: Optional[Dict[str, int]] = None,
+            logs: Optional[Dict[str, List[str]]] = None,
+            default_duration: float = 0.0
+    ):
+        """
+        FakeBackend class that runs stages in memory, for tests and benchmarks of the orchestration layer.
+
+        Every stage "runs" for its configured duration and then exits with its configured exit code.
+        All calls are recorded in `calls`, and pulling an image in `missing_images` fails.
+
+        Attributes:
+            durations (Dict[str, float]): Seconds each stage runs for, by stage name.
+            exit_codes (Dict[str, int]): The exit code of each stage, by stage name. Defaults to 0.
+            logs (Dict[str, List[str]]): The log lines each stage prints, by stage name.
+            default_duration (float): Seconds a stage without a configured duration runs for.
+        """
+        self.durations = durations or {}
+        self.exit_codes = exit_codes or {}
+        self.logs = logs or {}
+        self.default_duration = default_duration
+        self.containers: Dict[str, FakeContainer] = {}
+        self.images = set()
+        self.missing_images = set()
+        self.volumes = []
+        self.calls = []
+        self._lock = threading.Lock()
+
+
+    def _record(self, *call):
+        with self._lock:
+            self.calls.append(call)
+
+
+    def prepare(self, services: List[DockerComposeService], volumes: Optional[List[DockerComposeVolume]] = None):
+        self._record("prepare", len(services))
+        self.volumes = list(volumes or [])
+
+
+    def start_stage(self, service: DockerComposeService) -> str:
+        self._record("start", service.service_name)
+        container = FakeContainer(
+            service=service,
+            start_time=time.time(),
+            duration=self.durations.get(service.service_name, self.default_duration),
+            exit_code=self.exit_codes.get(service.service_name, 0),
+            logs=list(self.logs.get(service.service_name, [])),
+        )
+        with self._lock:
+            self.containers[service.service_name] = container
+        return f"fake-{service.service_name}"
+
+
+    def wait_stage(self, service_name: str) -> int:
+        container = self.containers[service_name]
+        remaining = container.start_time + container.duration - time.time()
+        if container.stopped.wait(max(0.0, remaining)):
+            return 137
+        self._record("exit", service_name, container.exit_code)
+        return container.exit_code
+
+
+    def stop_stage(self, service_name: str):
+        self._record("stop", service_name)
+        if service_name in self.containers:
+            self.containers[service_name].stopped.set()
+
+
+    def stage_logs(self, service_name: str, follow: bool = True) -> Iterator[str]:
+        yield from self.containers[service_name].logs
+
+
+    def stage_health(self, service_name: str) -> Optional[str]:
+        container = self.containers[service_name]
+        if not container.service.health_check:
+            return None
+        if container.stopped.is_set():
+            return "unhealthy"
+        return "healthy"
+
+
+    def image_id(self, image: str) -> Optional[str]:
+        if image not in self.images:
+            return None
+        return "sha256:" + hashlib.sha256(image.encode()).hexdigest()
+
+
+    def pull_image(self, image: str):
+        self._record("pull", image)
+        if image in self.missing_images:
+            raise Exception(f"Error pulling image {image}: not found")
+        self.images.add(image)
+
+
+    def tag_image(self, image: str, tag: str):
+        self._record("tag", image, tag)
+        self.images.add(tag)
+
+
+    def build_dependency_image(self, base_image: str, requirements_file: str, platform: Optional[str] = None) -> str:
+        self._record("build", base_image, requirements_file)
+        tag = f"{base_image}-baked"
+        self.images.add(tag)
+        return tag
@@ -0,0 +1,117 @@
+from typing import List, Optional, Tuple
+import os
+
+from docker_utils import DockerComposeService, DependsOnService, HealthCheck
+
+LOAD_BALANCER_IMAGE = "haproxy:2.8"
+LOAD_BALANCER_CONFIG_DIR = "load_balancer"
+CONTAINER_LOAD_BALANCER_CONFIG_PATH = "/usr/local/etc/haproxy/haproxy.cfg"
+
+HEALTH_CHECK_PATH = "/health"
+
+# Docker's embedded DNS server, so HAProxy picks up the new address of a replaced replica
+DOCKER_DNS_SERVER = "127.0.0.11:53"
+
+HAPROXY_CONFIG_TEMPLATE = """global
+    maxconn 4096
+
+defaults
+    mode http
+    timeout connect 5s
+    timeout client 60s
+    timeout server 60s
+    retries 3
+    option redispatch
+    retry-on conn-failure empty-response response-timeout
+    default-server init-addr last,libc,none
+
+resolvers docker
+    nameserver dns {dns_server}
+    hold valid 1s
+
+frontend {name}
+    bind *:{port}
+    default_backend {name}-replicas
+
+backend {name}-replicas
+    balance leastconn
+    option httpchk GET {health_check_path}
+    http-check expect status 200
+{servers}
+"""
+
+HAPROXY_SERVER_TEMPLATE = "    server {replica} {replica}:{port} check inter 2s fall 2 rise 1 resolvers docker"
+
+
+def split_port_mapping(port_mapping: str) -> Tuple[str, int]:
+    """
+    Split a port mapping like "8080:8080" or "127.0.0.1:80:8080" into its host part and container port.
+    """
+    host_part, _, container_port = str(port_mapping).rpartition(":")
+    return host_part, int(container_port.split("/")[0])
+
+
+def get_replica_health_check(port: int) -> HealthCheck:
+    # The serving images have Python but not necessarily curl
+    test = f"python -c \"import urllib.request; urllib.request.urlopen('http://localhost:{port}{HEALTH_CHECK_PATH}', timeout=2)\""
+    return HealthCheck(test=test, interval="2s", timeout="3s", retries=3)
+
+
+def get_haproxy_config(name: str, replicas: List[str], port: int) -> str:
+    """
+    Get an HAProxy configuration that balances the requests on `port` over the replicas with least-connections
+    routing.
+
+    Replicas that fail two health checks in a row are taken out of rotation until they pass one again, and
+    requests that fail to connect are retried on another replica, so replicas can be replaced one at a time
+    without failing requests.
+    """
+    servers = "\n".join(HAPROXY_SERVER_TEMPLATE.format(replica=replica, port=port) for replica in replicas)
+    return HAPROXY_CONFIG_TEMPLATE.format(
+        name=name,
+        port=port,
+        dns_server=DOCKER_DNS_SERVER,
+        health_check_path=HEALTH_CHECK_PATH,
+        servers=servers
+    )
+
+
+def write_haproxy_config(name: str, replicas: List[str], port: int, config_dir: str = LOAD_BALANCER_CONFIG_DIR) -> str:
+    """
+    Write the HAProxy configuration of a load balancer to "<config_dir>/<name>.cfg".
+
+    Returns:
+        str: The absolute path of the configuration file.
+    """
+    os.makedirs(config_dir, exist_ok=True)
+    config_path = os.path.abspath(os.path.join(config_dir, f"{name}.cfg"))
+    with open(config_path, "w") as f:
+        f.write(get_haproxy_config(name, replicas, port))
+    return config_path
+
+
+def get_load_balancer_service(
+    name: str,
+    replicas: List[str],
+    ports: Optional[List[str]],
+    port: int,
+    networks: Optional[List[str]] = None,
+    image: str = LOAD_BALANCER_IMAGE,
+    config_dir: str = LOAD_BALANCER_CONFIG_DIR
+) -> DockerComposeService:
+    """
+    Get a detached HAProxy service named `name` that publishes `ports` and balances them over the replicas.
+    """
+    config_path = write_haproxy_config(name, replicas, port, config_dir)
+    return DockerComposeService(
+        service_name=name,
+        image=image,
+        ports=ports,
+        volumes=[f"{config_path}:{CONTAINER_LOAD_BALANCER_CONFIG_PATH}:ro"],
+        networks=networks,
+        depends_on=[DependsOnService(services=replica, condition="service_started") for replica in replicas],
+        detach_on_build=True,
+        cpu_request=0.0,
+        inputs=[],
+        outputs=[]
+    )
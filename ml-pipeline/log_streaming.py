@@ -0,0 +1,106 @@
+from typing import Callable, Dict, Iterator, Optional
+import os
+import queue
+import threading
+
+LOG_DIR_NAME = "logs"
+
+
+class LogMultiplexer:
+    def __init__(self, log_dir: Optional[str] = LOG_DIR_NAME, console: bool = True, console_buffer_size: int = 10000):
+        """
+        LogMultiplexer class to stream the logs of all running stages concurrently.
+
+        Every stage gets its own reader thread that writes its lines to "<log_dir>/<stage_name>.log". Lines are
+        also handed to a single console printer through a bounded queue. When the console cannot keep up and
+        the queue is full, lines are dropped from the console (never from the files) and the number of dropped
+        lines is reported, so a slow console never holds up the readers or the pipeline.
+
+        Attributes:
+            log_dir (Optional[str]): The directory to write the per-stage log files to. None disables the files.
+            console (bool): Whether to print the lines of all stages, prefixed with the stage name.
+            console_buffer_size (int): The maximum number of lines waiting to be printed.
+        """
+        self.log_dir = log_dir
+        self.console = console
+        self._console_queue = queue.Queue(maxsize=console_buffer_size)
+        self._readers: Dict[str, threading.Thread] = {}
+        self._dropped = 0
+        self._dropped_lock = threading.Lock()
+        self._printer = None
+
+        if self.log_dir:
+            os.makedirs(self.log_dir, exist_ok=True)
+        if self.console:
+            self._printer = threading.Thread(target=self._print_lines, name="log-console", daemon=True)
+            self._printer.start()
+
+
+    def _print_lines(self):
+        while True:
+            item = self._console_queue.get()
+            if item is None:
+                break
+
+            with self._dropped_lock:
+                dropped, self._dropped = self._dropped, 0
+            if dropped:
+                print(f"[{dropped} log lines dropped from the console, see {self.log_dir or 'the stage logs'}]")
+
+            stage_name, line = item
+            print(f"{stage_name} | {line}")
+
+
+    def _read_lines(self, stage_name: str, lines: Iterator[str], on_end: Optional[Callable[[str], None]], on_line: Optional[Callable[[str, str], None]]):
+        log_file = open(os.path.join(self.log_dir, f"{stage_name}.log"), "w") if self.log_dir else None
+        try:
+            for line in lines:
+                if on_line:
+                    on_line(stage_name, line)
+                if log_file:
+                    log_file.write(line + "\n")
+                    log_file.flush()
+                if self.console:
+                    try:
+                        self._console_queue.put_nowait((stage_name, line))
+                    except queue.Full:
+                        with self._dropped_lock:
+                            self._dropped += 1
+        except Exception as e:
+            print(f"Error reading the logs of stage {stage_name}: {e}")
+        finally:
+            if log_file:
+                log_file.close()
+            if on_end:
+                on_end(stage_name)
+
+
+    def add_stage(self, stage_name: str, lines: Iterator[str], on_end: Optional[Callable[[str], None]] = None, on_line: Optional[Callable[[str, str], None]] = None):
+        """
+        Start streaming the lines of a stage in the background. `on_line` is called with every line from the
+        reader thread (so it must be fast) and `on_end` once the stream ends.
+        """
+        reader = threading.Thread(target=self._read_lines, args=(stage_name, lines, on_end, on_line), name=f"logs-{stage_name}", daemon=True)
+        self._readers[stage_name] = reader
+        reader.start()
+
+
+    def wait(self, stage_name: str, timeout: Optional[float] = None):
+        """
+        Wait until all lines of the stage have been read, including those of a stage that is restarted meanwhile.
+        """
+        while stage_name in self._readers:
+            reader = self._readers[stage_name]
+            reader.join(timeout)
+            if self._readers.get(stage_name) is reader:
+                break
+
+
+    def close(self):
+        """
+        Wait for the console to print the lines queued so far and stop it.
+        """
+        if self._printer:
+            self._console_queue.put(None)
+            self._printer.join()
+            self._printer = None
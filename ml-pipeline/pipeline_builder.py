@@ -1,9 +1,32 @@
 import os
+import time
+import uuid
 
-from typing import List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from typing import Dict, List, Optional, Tuple, Union
 from dataclasses import dataclass
 
-from docker_utils import DockerComposeService, DockerComposeClient, HealthCheck, DependsOnService
+from docker_utils import DockerComposeService, DockerComposeClient, HealthCheck, DependsOnService, get_mirror_image
+from artifacts import (
+    ARTIFACT_KEEPER_STAGE_NAME,
+    ARTIFACT_RESET_STAGE_NAME,
+    ARTIFACT_STAGE_NAMES,
+    Artifact,
+    fits_tmpfs,
+    get_artifact_volume,
+    get_export_service,
+    get_keeper_service,
+    get_reset_service,
+)
+from dag_scheduler import DAGScheduler
+from execution_backend import ExecutionBackend, ComposeBackend
+from log_streaming import LogMultiplexer, LOG_DIR_NAME
+from resource_packer import CpuPacker, get_thread_environment
+from pipeline_tracer import PipelineTracer, REQUIREMENTS_INSTALLED_MARKER, load_stage_phases
+from load_balancer import LOAD_BALANCER_IMAGE, get_load_balancer_service, get_replica_health_check, split_port_mapping
+from stage_cache import StageCache
 
 CONTAINER_REQUIREMENTS_FILE_PATH = f"/opt/ml/code/requirements.txt"
 
@@ -13,7 +36,8 @@ def get_command_and_entrypoint(
     command: Optional[str],
     arguments: Optional[List[str]],
     requirements: Optional[str],
-    shell_command: Optional[str] = "/bin/bash"
+    shell_command: Optional[str] = "/bin/bash",
+    install_marker: Optional[str] = None
 ) -> Tuple[str, str]:
     """
     Get the command and entrypoint for the Docker service.
@@ -33,6 +57,8 @@ def get_command_and_entrypoint(
                                       install the requirements before executing the command/entrypoint.
         shell_command (Optional[str]): The shell command override. Default is "/bin/bash". This is used to 
                                        specify the shell that will be used to run the commands inside the container.
+        install_marker (Optional[str]): A line echoed once the requirements are installed, e.g. for the pipeline 
+                                        tracer to tell the install time apart from the command's runtime.
     
                                        
     Returns:
@@ -70,6 +96,8 @@ def get_command_and_entrypoint(
         raise ValueError("Cannot specify a requirements file without a command or entrypoint.")
 
 
+    arguments = arguments or []
+
     if install_requirements:
         # Merge the command and arguments
         command = command + " " + " ".join(arguments) if command else " ".join(arguments)
@@ -79,6 +107,9 @@ def get_command_and_entrypoint(
         if entrypoint:
             entrypoint_exec = "exec " + entrypoint
         
+        if install_marker:
+            install_requirements += f" && echo {install_marker}"
+
         sub_command = f"{install_requirements} && {entrypoint_exec} {command}"
         
          # Escape single quotes
@@ -95,9 +126,9 @@ def get_command_and_entrypoint(
         command = command + " " + " ".join(arguments) if command else " ".join(arguments)
 
         # remove double spaces
-        docker_command = " ".join(docker_command.split())
+        docker_command = " ".join(command.split())
 
-        docker_entrypoint = entrypoint or docker_command.split(" ")[0] 
+        docker_entrypoint = entrypoint or ""
     
     return docker_entrypoint, docker_command
 
@@ -111,7 +142,18 @@ class DockerMLPipelineBuilder:
             source_code_dir: Optional[str] = None,
             requirements_file: Optional[str] = None,
             environment: Optional[List[str]] = None,
-            compose_client: Optional[DockerComposeClient] = None
+            compose_client: Optional[DockerComposeClient] = None,
+            bake_requirements: bool = True,
+            cpu_budget: Optional[float] = None,
+            stage_cache: Optional[StageCache] = None,
+            backend: Optional[ExecutionBackend] = None,
+            log_dir: Optional[str] = LOG_DIR_NAME,
+            console_logs: bool = True,
+            cpu_packer: Optional[CpuPacker] = None,
+            trace_file: Optional[str] = None,
+            tmpfs_artifact_size: Optional[str] = None,
+            registry_mirror: Optional[str] = None,
+            pull_workers: Optional[int] = None
         ):
         """
         DockerMLPipelineBuilder class to build a machine learning pipeline using Docker Compose.
@@ -122,6 +164,34 @@ class DockerMLPipelineBuilder:
             source_code_dir (str): The path to the source code directory.
             requirements_file (str): The path to the requirements file within the source code directory.
             compose_client (DockerComposeClient): The DockerComposeClient instance.
+            bake_requirements (bool): Install the requirements file into a derived image that is built once per 
+                (image, requirements) pair and reused on later runs, instead of running `pip install` every time 
+                a stage starts. Defaults to True.
+            cpu_budget (float): The number of CPUs that concurrently running stages may reserve in total. 
+                Defaults to the number of CPUs on the host.
+            stage_cache (StageCache): The cache used to skip stages whose image, command, environment, source code 
+                and declared inputs are unchanged and whose declared outputs still exist. Only stages that declare 
+                `outputs` are cached. Defaults to a StageCache in ".pipeline_cache".
+            backend (ExecutionBackend): The backend that runs the stages, e.g. a DockerEngineBackend to talk to the 
+                Docker Engine API directly or a FakeBackend for tests. Defaults to a ComposeBackend that runs the 
+                stages with docker-compose.
+            log_dir (str): The directory to write a log file per stage to. Defaults to "logs".
+            console_logs (bool): Whether to also print the logs of all stages, prefixed with the stage name. 
+                Defaults to True.
+            cpu_packer (CpuPacker): If set, every stage without an explicit `cpuset` is pinned to its own set of 
+                ceil(cpu_request) host cores while it runs, and gets matching OMP/BLAS/TensorFlow thread-count 
+                environment variables. Stages with a `cpu_request` of 0 are not pinned. Defaults to None.
+            trace_file (str): If set, every run records the image pulls, container starts, dependency installs, 
+                user code runtime, log drain and exit of every stage plus container CPU/memory samples, writes them 
+                to this file in Chrome trace-event format and prints a summary table compared to the previous run.
+                Defaults to None.
+            tmpfs_artifact_size (str): Artifacts whose `size` is at most this size (e.g. "2g") are kept in RAM-backed 
+                tmpfs volumes instead of regular named volumes. Defaults to None (no tmpfs volumes).
+            registry_mirror (str): The address of a pull-through registry mirror (e.g. "localhost:5000", see 
+                `start_registry_mirror`) to pull Docker Hub images from before falling back to Docker Hub itself.
+                Defaults to None.
+            pull_workers (int): The number of images pulled concurrently by `prepare_images`. Defaults to one 
+                per image.
         """
         self.image = image
         self.platform = platform
@@ -129,8 +199,26 @@ class DockerMLPipelineBuilder:
         self.source_code_dir = source_code_dir
         self.requirements_file = requirements_file
         self.environment = environment
+        self.bake_requirements = bake_requirements
+        self.cpu_budget = cpu_budget or os.cpu_count()
+        self.stage_cache = stage_cache or StageCache()
+        self._stage_keys = {}
         self.services = []
         self.compose_client = compose_client or DockerComposeClient(self.services)
+        self.backend = backend or ComposeBackend(self.compose_client)
+        self.log_dir = log_dir
+        self.console_logs = console_logs
+        self.cpu_packer = cpu_packer
+        self._packed_stages = {}
+        self.trace_file = trace_file
+        self.tracer = None
+        self.tmpfs_artifact_size = tmpfs_artifact_size
+        self.artifacts: Dict[str, Artifact] = {}
+        self._artifact_producers: Dict[str, str] = {}
+        self._stage_artifacts: Dict[str, List[str]] = {}
+        self.registry_mirror = registry_mirror
+        self.pull_workers = pull_workers
+        self._serving_replicas: Dict[str, List[str]] = {}
 
 
     def add_preprocessing_stage(
@@ -144,10 +232,19 @@ class DockerMLPipelineBuilder:
             arguments: Optional[List[str]] = None,
             volumes: Optional[List[str]] = [], 
             environment: Optional[List[str]] = None,
-            depends_on: Optional[List[DependsOnService]] = None
+            depends_on: Optional[List[Union[str, DependsOnService]]] = None,
+            stage_name: str = "preprocessing",
+            cpu_request: Optional[float] = None,
+            inputs: Optional[List[Union[str, Artifact]]] = None,
+            outputs: Optional[List[Union[str, Artifact]]] = None,
+            cpus: Optional[float] = None,
+            cpuset: Optional[str] = None,
+            mem_limit: Optional[str] = None,
+            shm_size: Optional[str] = None,
+            ulimits: Optional[Dict[str, Union[int, Tuple[int, int]]]] = None
         ):
         self.add_stage(
-            stage_name="preprocessing",
+            stage_name=stage_name,
             image=image,
             platform=platform,
             runtime=runtime,
@@ -157,7 +254,15 @@ class DockerMLPipelineBuilder:
             arguments=arguments,
             volumes=volumes,
             environment=environment,
-            depends_on=depends_on
+            depends_on=depends_on,
+            cpu_request=cpu_request,
+            inputs=inputs,
+            outputs=outputs,
+            cpus=cpus,
+            cpuset=cpuset,
+            mem_limit=mem_limit,
+            shm_size=shm_size,
+            ulimits=ulimits
         )
 
 
@@ -172,10 +277,19 @@ class DockerMLPipelineBuilder:
             arguments: Optional[List[str]] = None,
             volumes: Optional[List[str]] = [], 
             environment: Optional[List[str]] = None,
-            depends_on: Optional[List[DependsOnService]] = None
+            depends_on: Optional[List[Union[str, DependsOnService]]] = None,
+            stage_name: str = "training",
+            cpu_request: Optional[float] = None,
+            inputs: Optional[List[Union[str, Artifact]]] = None,
+            outputs: Optional[List[Union[str, Artifact]]] = None,
+            cpus: Optional[float] = None,
+            cpuset: Optional[str] = None,
+            mem_limit: Optional[str] = None,
+            shm_size: Optional[str] = None,
+            ulimits: Optional[Dict[str, Union[int, Tuple[int, int]]]] = None
         ):
         self.add_stage(
-            stage_name="training",
+            stage_name=stage_name,
             image=image,
             platform=platform,
             runtime=runtime,
@@ -185,7 +299,15 @@ class DockerMLPipelineBuilder:
             arguments=arguments,
             volumes=volumes,
             environment=environment,
-            depends_on=depends_on
+            depends_on=depends_on,
+            cpu_request=cpu_request,
+            inputs=inputs,
+            outputs=outputs,
+            cpus=cpus,
+            cpuset=cpuset,
+            mem_limit=mem_limit,
+            shm_size=shm_size,
+            ulimits=ulimits
         )
 
 
@@ -202,10 +324,57 @@ class DockerMLPipelineBuilder:
             environment: Optional[List[str]] = None,
             ports: Optional[List[str]] = ["8080:8080"],
             networks: Optional[List[str]] = None,
-            depends_on: Optional[List[DependsOnService]] = None
+            depends_on: Optional[List[Union[str, DependsOnService]]] = None,
+            stage_name: str = "serving",
+            cpu_request: Optional[float] = None,
+            inputs: Optional[List[Union[str, Artifact]]] = None,
+            cpus: Optional[float] = None,
+            cpuset: Optional[str] = None,
+            mem_limit: Optional[str] = None,
+            shm_size: Optional[str] = None,
+            ulimits: Optional[Dict[str, Union[int, Tuple[int, int]]]] = None,
+            replicas: int = 1,
+            load_balancer_image: str = LOAD_BALANCER_IMAGE
     ):
+        """
+        Add a serving stage, which keeps running after the pipeline completed.
+
+        With `replicas` > 1 the stage runs as `replicas` identical services named "<stage_name>-1" to 
+        "<stage_name>-N" without host ports, behind an HAProxy load balancer service named `stage_name` that 
+        publishes `ports`. The replicas must listen on the container port of the first port mapping and answer 
+        GET /health with 200 once they are ready. The load balancer routes each request to the replica with the 
+        fewest active connections and stops routing to replicas that fail their health checks. Use 
+        `rolling_update_serving` to replace the replicas one at a time, e.g. after deploying a new model.
+        """
+        if replicas > 1:
+            self._add_serving_replicas(
+                stage_name=stage_name,
+                replicas=replicas,
+                load_balancer_image=load_balancer_image,
+                image=image,
+                platform=platform,
+                runtime=runtime,
+                command=command,
+                source_code_dir=source_code_dir,
+                requirements_file=requirements_file,
+                arguments=arguments,
+                volumes=volumes,
+                environment=environment,
+                ports=ports,
+                networks=networks,
+                depends_on=depends_on,
+                cpu_request=cpu_request,
+                inputs=inputs,
+                cpus=cpus,
+                cpuset=cpuset,
+                mem_limit=mem_limit,
+                shm_size=shm_size,
+                ulimits=ulimits
+            )
+            return
+
         self.add_stage(
-            stage_name="serving",
+            stage_name=stage_name,
             image=image,
             platform=platform,
             runtime=runtime,
@@ -218,10 +387,113 @@ class DockerMLPipelineBuilder:
             ports=ports,
             networks=networks,
             depends_on=depends_on,
-            detach_on_build=True
+            detach_on_build=True,
+            cpu_request=cpu_request,
+            inputs=inputs,
+            cpus=cpus,
+            cpuset=cpuset,
+            mem_limit=mem_limit,
+            shm_size=shm_size,
+            ulimits=ulimits
         )
 
 
+    def _add_serving_replicas(
+            self,
+            stage_name: str,
+            replicas: int,
+            load_balancer_image: str,
+            ports: Optional[List[str]],
+            networks: Optional[List[str]],
+            depends_on: Optional[List[Union[str, DependsOnService]]],
+            **stage_args
+    ):
+        if self.compose_client.get_service(stage_name) is not None:
+            raise ValueError(f"A stage named '{stage_name}' already exists")
+
+        # Resolved once, otherwise every replica would depend on the previous replica
+        if depends_on is None:
+            depends_on = [self.compose_client.services[-1].service_name] if self.compose_client.services else []
+
+        container_port = split_port_mapping(ports[0])[1] if ports else 8080
+        replica_names = [f"{stage_name}-{index}" for index in range(1, replicas + 1)]
+        for replica_name in replica_names:
+            self.add_stage(
+                stage_name=replica_name,
+                networks=networks,
+                depends_on=depends_on,
+                detach_on_build=True,
+                health_check=get_replica_health_check(container_port),
+                **stage_args
+            )
+
+        self.compose_client.add_service(get_load_balancer_service(
+            name=stage_name,
+            replicas=replica_names,
+            ports=ports,
+            port=container_port,
+            networks=networks,
+            image=load_balancer_image
+        ))
+        self._serving_replicas[stage_name] = replica_names
+
+
+    def rolling_update_serving(
+            self,
+            stage_name: str = "serving",
+            image: Optional[str] = None,
+            environment: Optional[List[str]] = None,
+            health_timeout: float = 120.0
+    ):
+        """
+        Replace the replicas of a running serving stage one at a time, so the load balancer always has healthy 
+        replicas to route to.
+
+        Every replica is stopped, started again (with the new image or environment, if given, so it loads the 
+        currently deployed model) and must pass its health check before the next one is replaced. The rollout 
+        stops at the first replica that does not become healthy, leaving the remaining replicas untouched.
+
+        Args:
+            stage_name (str): The name of the serving stage, added with `replicas` > 1.
+            image (Optional[str]): A new image for the replicas.
+            environment (Optional[List[str]]): A new environment for the replicas.
+            health_timeout (float): Seconds to wait for a replaced replica to become healthy.
+
+        Raises:
+            Exception: If a replaced replica does not become healthy within `health_timeout`.
+        """
+        if stage_name not in self._serving_replicas:
+            raise ValueError(f"Stage '{stage_name}' is not a serving stage with replicas")
+
+        services = {service.service_name: service for service in self.compose_client.services}
+        for replica_name in self._serving_replicas[stage_name]:
+            service = services[replica_name]
+            if image:
+                service.image = image
+            if environment is not None:
+                service.environment = environment
+
+            print(f"Replacing {replica_name}")
+            self.backend.stop_stage(replica_name)
+            self.backend.start_stage(service)
+            if getattr(self, "log_multiplexer", None):
+                self.log_multiplexer.add_stage(replica_name, self.backend.stage_logs(replica_name))
+
+            self._wait_until_healthy(replica_name, health_timeout)
+            print(f"{replica_name} is healthy")
+
+
+    def _wait_until_healthy(self, stage_name: str, timeout: float):
+        deadline = time.time() + timeout
+        while True:
+            health = self.backend.stage_health(stage_name)
+            if health in ("healthy", None):
+                return
+            if time.time() > deadline:
+                raise Exception(f"Error updating stage {stage_name}: not healthy after {timeout:.0f}s (status: {health})")
+            time.sleep(1.0)
+
+
     def add_stage(
             self,
             stage_name: str,
@@ -238,39 +510,91 @@ class DockerMLPipelineBuilder:
             working_dir: Optional[str] = None,
             entrypoint: Optional[str] = None,
             networks: Optional[List[str]] = None,
-            depends_on: Optional[List[DependsOnService]] = None,
+            depends_on: Optional[List[Union[str, DependsOnService]]] = None,
             restart: Optional[str] = None,
             health_check: Optional[HealthCheck] = None,
             source_code_dir: Optional[str] = None,
-            detach_on_build: Optional[bool] = False
+            detach_on_build: Optional[bool] = False,
+            cpu_request: Optional[float] = None,
+            inputs: Optional[List[Union[str, Artifact]]] = None,
+            outputs: Optional[List[Union[str, Artifact]]] = None,
+            cpus: Optional[float] = None,
+            cpuset: Optional[str] = None,
+            mem_limit: Optional[str] = None,
+            shm_size: Optional[str] = None,
+            ulimits: Optional[Dict[str, Union[int, Tuple[int, int]]]] = None
     ):
+        """
+        Add a stage to the pipeline.
+
+        Stages form a dependency graph: a stage starts as soon as all stages in `depends_on` have completed 
+        successfully (or have started, for detached stages), and independent stages run concurrently. When 
+        `depends_on` is None the stage depends on the previously added stage; pass an empty list for a stage 
+        without dependencies. Dependencies can be given as stage names or DependsOnService objects.
+
+        `cpu_request` is the number of CPUs the stage reserves from the builder's `cpu_budget` while it runs. It 
+        defaults to `cpus` (the container's CPU limit) or 1. `cpuset`, `mem_limit`, `shm_size` and `ulimits` are 
+        passed on to the container, e.g. `mem_limit="4g"`, `shm_size="1g"`, `ulimits={"nofile": (1024, 4096)}`.
+
+        `inputs` and `outputs` are host paths (files or directories) the stage reads and writes, or Artifacts. A 
+        stage that declares outputs is skipped when it already ran with the same inputs, source code, image and 
+        command and its outputs are unchanged since. Stages that produce artifacts always run.
+
+        An Artifact in `outputs` is backed by a named volume (or a tmpfs volume, see `tmpfs_artifact_size`) 
+        mounted at `artifact.path`. An Artifact in `inputs` is mounted read-only and the stage depends on the 
+        stage producing it, in addition to `depends_on`.
+        """
+        if stage_name in ARTIFACT_STAGE_NAMES:
+            raise ValueError(f"The stage name '{stage_name}' is reserved")
+        if self.compose_client.get_service(stage_name) is not None:
+            raise ValueError(f"A stage named '{stage_name}' already exists")
+
         image = image or self.image
         platform = platform or self.platform
         environment = environment or self.environment
         runtime = runtime or self.runtime
 
+        volumes = list(volumes or [])
+        input_artifacts = [artifact for artifact in inputs or [] if isinstance(artifact, Artifact)]
+        output_artifacts = [artifact for artifact in outputs or [] if isinstance(artifact, Artifact)]
+        inputs = [os.path.abspath(path) for path in inputs or [] if not isinstance(path, Artifact)]
+        outputs = [os.path.abspath(path) for path in outputs or [] if not isinstance(path, Artifact)]
+        volumes.extend(self._get_artifact_volumes(stage_name, input_artifacts, output_artifacts))
+
         source_code_dir = source_code_dir or self.source_code_dir
         if source_code_dir:
             absolute_path = os.path.abspath(source_code_dir)
             volumes.append(f"{absolute_path}:/opt/ml/code")      
+            inputs.append(absolute_path)
             if not working_dir:
                 working_dir = "/opt/ml/code"
         
-        if not depends_on:
-            depends_on = []
-            if self.compose_client.services:
-                dependent_service = DependsOnService(
-                    services=self.compose_client.services[-1].service_name,
-                    condition="service_completed_successfully"
-                )
-                depends_on.append(dependent_service)
+        if depends_on is None:
+            depends_on = [self.compose_client.services[-1].service_name] if self.compose_client.services else []
 
+        # Consumers of an artifact run after its producer
+        dependency_names = [dependency.services if isinstance(dependency, DependsOnService) else dependency for dependency in depends_on]
+        for artifact in input_artifacts:
+            producer = self._artifact_producers[artifact.name]
+            if producer not in dependency_names:
+                dependency_names.append(producer)
+                depends_on = list(depends_on) + [producer]
 
+        depends_on = [self._get_dependency(dependency) for dependency in depends_on]
+
+
+        requirements_file = requirements_file or self.requirements_file
+        if requirements_file and not (command or entrypoint):
+            raise ValueError("Cannot specify a requirements file without a command or entrypoint.")
+
+        # Baked requirements are installed into the stage image before the pipeline runs, see _bake_stage_images
         entrypoint, command = get_command_and_entrypoint(
             entrypoint=entrypoint, 
             command=command, 
             arguments=arguments, 
-            requirements=requirements_file or self.requirements_file
+            requirements=None if self.bake_requirements else requirements_file,
+            # Only traced runs need to know when the requirements were installed
+            install_marker=REQUIREMENTS_INSTALLED_MARKER if self.trace_file else None
         )
 
         service = DockerComposeService(
@@ -289,25 +613,331 @@ class DockerMLPipelineBuilder:
             depends_on=depends_on,
             restart=restart,
             health_check=health_check,
-            detach_on_build=detach_on_build
+            detach_on_build=detach_on_build,
+            requirements_file=requirements_file if self.bake_requirements else None,
+            cpu_request=cpu_request or cpus or 1.0,
+            inputs=inputs,
+            outputs=outputs,
+            cpus=cpus,
+            cpuset=cpuset,
+            mem_limit=mem_limit,
+            shm_size=shm_size,
+            ulimits=ulimits
         )
         self.compose_client.add_service(service)
 
 
-    def build_and_run_pipeline(self):
-        detatched_services = [service.service_name for service in self.compose_client.services if service.detach_on_build]
-        transient_services = [service.service_name for service in self.compose_client.services if not service.detach_on_build]
+    def _get_artifact_volumes(self, stage_name: str, input_artifacts: List[Artifact], output_artifacts: List[Artifact]) -> List[str]:
+        volumes = []
+        for artifact in input_artifacts:
+            if artifact.name not in self._artifact_producers:
+                raise ValueError(f"Artifact '{artifact.name}' is not produced by any stage, stages must be added after the stages producing their inputs")
+            volumes.append(f"{artifact.volume_name}:{artifact.path}:ro")
 
-        return_code = self.compose_client.compose_up(args="--build --detach", services=transient_services)
+        for artifact in output_artifacts:
+            if artifact.name in self._artifact_producers:
+                raise ValueError(f"Artifact '{artifact.name}' is already produced by stage '{self._artifact_producers[artifact.name]}'")
+            volumes.append(f"{artifact.volume_name}:{artifact.path}")
 
-        return_code = self.compose_client.follow_logs(services=transient_services)
+        for artifact in output_artifacts:
+            self.artifacts[artifact.name] = artifact
+            self._artifact_producers[artifact.name] = stage_name
+            self.compose_client.add_volume(get_artifact_volume(artifact, tmpfs=fits_tmpfs(artifact, self.tmpfs_artifact_size)))
 
-        if return_code != 0:
-            raise Exception("Error starting the pipeline")
+        self._stage_artifacts[stage_name] = [artifact.name for artifact in input_artifacts + output_artifacts]
+        return volumes
 
-        return_code = self.compose_client.compose_up(args="--build --detach", services=detatched_services)
 
-        return_code = self.compose_client.follow_logs(services=detatched_services)
+    def _add_artifact_stages(self):
+        """
+        Add the helper stages of the artifacts: a detached stage keeping the tmpfs volumes mounted for the whole 
+        run, which every stage using them waits for, a stage emptying the named volumes left from the previous 
+        run, which their producers wait for, and a stage exporting the persisted artifacts to the host once all 
+        transient stages completed.
+        """
+        services = self.compose_client.services
+        services[:] = [service for service in services if service.service_name not in ARTIFACT_STAGE_NAMES]
+
+        named_artifacts = [artifact for artifact in self.artifacts.values() if not fits_tmpfs(artifact, self.tmpfs_artifact_size)]
+        if named_artifacts:
+            named_producers = {self._artifact_producers[artifact.name] for artifact in named_artifacts}
+            for service in services:
+                if service.service_name in named_producers:
+                    reset = DependsOnService(services=ARTIFACT_RESET_STAGE_NAME, condition="service_completed_successfully")
+                    service.depends_on = [reset] + [dependency for dependency in service.depends_on or [] if dependency.services != ARTIFACT_RESET_STAGE_NAME]
+            services.insert(0, get_reset_service(named_artifacts, self.image))
+
+        tmpfs_artifacts = [artifact for artifact in self.artifacts.values() if fits_tmpfs(artifact, self.tmpfs_artifact_size)]
+        if tmpfs_artifacts:
+            tmpfs_names = {artifact.name for artifact in tmpfs_artifacts}
+            for service in services:
+                uses_tmpfs = any(name in tmpfs_names for name in self._stage_artifacts.get(service.service_name, []))
+                depends_on = service.depends_on or []
+                if uses_tmpfs and not any(dependency.services == ARTIFACT_KEEPER_STAGE_NAME for dependency in depends_on):
+                    service.depends_on = [DependsOnService(services=ARTIFACT_KEEPER_STAGE_NAME, condition="service_started")] + depends_on
+            services.insert(0, get_keeper_service(tmpfs_artifacts, self.image))
+
+        persisted_artifacts = [artifact for artifact in self.artifacts.values() if artifact.persist_path]
+        if persisted_artifacts:
+            depends_on = [
+                DependsOnService(services=service.service_name, condition="service_completed_successfully")
+                for service in services if not service.detach_on_build
+            ]
+            services.append(get_export_service(persisted_artifacts, self.image, depends_on))
+
+
+    def _stop_artifact_keeper(self):
+        if any(service.service_name == ARTIFACT_KEEPER_STAGE_NAME for service in self.compose_client.services):
+            self.backend.stop_stage(ARTIFACT_KEEPER_STAGE_NAME)
+
+
+    def _get_dependency(self, dependency: Union[str, DependsOnService]) -> DependsOnService:
+        if isinstance(dependency, DependsOnService):
+            return dependency
+
+        service = self.compose_client.get_service(dependency)
+        if service is None:
+            raise ValueError(f"Unknown stage '{dependency}', stages must be added after the stages they depend on")
+
+        # Detached stages (e.g. serving) never complete, so dependents only wait for them to start
+        condition = "service_started" if service.detach_on_build else "service_completed_successfully"
+        return DependsOnService(services=dependency, condition=condition)
+
+
+    def get_dependency_graph(self):
+        return {
+            service.service_name: [dependency.services for dependency in service.depends_on or []]
+            for service in self.compose_client.services
+        }
+
+
+    def _bake_stage_images(self):
+        """
+        Replace the image of every stage with baked requirements by an image that has them installed.
 
-        if return_code != 0:
-            raise Exception("Error starting the pipeline")
+        Each distinct (image, platform, requirements) combination is only built once, and the built images
+        are tagged by the hash of their inputs so later runs reuse them from the local image cache.
+        """
+        baked_images = {}
+        for service in self.compose_client.services:
+            if not service.requirements_file or not service.image:
+                continue
+
+            key = (service.image, service.platform, os.path.abspath(service.requirements_file))
+            if key not in baked_images:
+                with self._trace("dependency install (image build)", image=service.image):
+                    baked_images[key] = self.backend.build_dependency_image(
+                        base_image=service.image,
+                        requirements_file=service.requirements_file,
+                        platform=service.platform
+                    )
+            service.image = baked_images[key]
+            service.requirements_file = None
+
+
+    def prepare_images(self) -> Dict[str, float]:
+        """
+        Pull the distinct images of all stages in parallel, instead of one after another as the stages start.
+
+        Images that are already present locally are not pulled again. With a `registry_mirror`, Docker Hub images 
+        are pulled from the mirror and tagged with their original name, falling back to Docker Hub if the mirror 
+        fails.
+
+        Returns:
+            Dict[str, float]: The seconds spent pulling each image that was pulled.
+
+        Raises:
+            Exception: If any image could not be pulled.
+        """
+        images = []
+        for service in self.compose_client.services:
+            if service.image and service.image not in images:
+                images.append(service.image)
+
+        missing_images = [image for image in images if not self.backend.image_id(image)]
+        if not missing_images:
+            return {}
+
+        print(f"Pulling {len(missing_images)} images: {', '.join(missing_images)}")
+        pull_times = {}
+        errors = []
+        with ThreadPoolExecutor(max_workers=self.pull_workers or len(missing_images)) as executor:
+            futures = {image: executor.submit(self._pull_image, image) for image in missing_images}
+            for image, future in futures.items():
+                try:
+                    pull_times[image] = future.result()
+                except Exception as e:
+                    errors.append(str(e))
+
+        for image, pull_time in pull_times.items():
+            print(f"Pulled {image} in {pull_time:.1f}s")
+
+        if errors:
+            raise Exception("Error preparing the pipeline images:\n" + "\n".join(errors))
+
+        return pull_times
+
+
+    def _pull_image(self, image: str) -> float:
+        start_time = time.time()
+        with self._trace(f"image pull ({image})", image=image):
+            mirror_image = get_mirror_image(image, self.registry_mirror) if self.registry_mirror else None
+            if mirror_image:
+                try:
+                    self.backend.pull_image(mirror_image)
+                    self.backend.tag_image(mirror_image, image)
+                    return time.time() - start_time
+                except Exception as e:
+                    print(f"Pulling {image} from the registry mirror failed, pulling it from the upstream registry: {e}")
+
+            self.backend.pull_image(image)
+        return time.time() - start_time
+
+
+    def _trace(self, name: str, track: str = "pipeline", **args):
+        if not self.tracer:
+            return nullcontext()
+        return self.tracer.span(name, track, **args)
+
+
+    def _start_stage(self, service: DockerComposeService):
+        stage_name = service.service_name
+        self._pending_cache_records.pop(stage_name, None)
+
+        if service.detach_on_build or not service.outputs or stage_name in self._artifact_producers.values():
+            # Stages without declared outputs (or producing artifacts, which are not fingerprinted) always run, 
+            # and so always invalidate the stages downstream of them
+            self._stage_keys[stage_name] = uuid.uuid4().hex
+        else:
+            stage_key = self.stage_cache.get_stage_key(
+                image_id=self.backend.image_id(service.image) or service.image,
+                entrypoint=service.entrypoint,
+                command=service.command,
+                environment=service.environment,
+                volumes=service.volumes,
+                inputs=service.inputs,
+                upstream_keys=[self._stage_keys.get(dependency.services, "") for dependency in service.depends_on or []]
+            )
+            self._stage_keys[stage_name] = stage_key
+
+            if self.stage_cache.is_cached(stage_name, stage_key, service.outputs):
+                print(f"Skipping stage {stage_name}: outputs are up to date")
+                if self.tracer:
+                    self.tracer.instant("cache hit", stage_name)
+                self._scheduler.notify_exit(stage_name, 0)
+                return
+
+            self.stage_cache.invalidate(stage_name)
+            self._pending_cache_records[stage_name] = stage_key
+
+        # Helper stages reserving no CPU (artifact keeper and export, load balancer) share the unpinned cores
+        if self.cpu_packer and not service.cpuset and service.cpu_request:
+            self._pin_stage(service)
+
+        if self.tracer and service.image and not self.backend.image_id(service.image):
+            with self._trace("image pull", stage_name, image=service.image):
+                self.backend.pull_image(service.image)
+
+        with self._trace("container start", stage_name):
+            self.backend.start_stage(service)
+
+        if self.tracer:
+            self.tracer.stage_started(stage_name, stats_reader=self.backend.stage_stats)
+            self.log_multiplexer.add_stage(stage_name, self.backend.stage_logs(stage_name), on_end=self.tracer.logs_drained, on_line=self.tracer.log_line)
+        else:
+            self.log_multiplexer.add_stage(stage_name, self.backend.stage_logs(stage_name))
+
+        if service.detach_on_build:
+            # Detached stages (e.g. serving) keep running, dependents only wait for them to start
+            self._scheduler.notify_exit(stage_name, 0)
+        else:
+            self.backend.track_exit(stage_name)
+
+
+    def _pin_stage(self, service: DockerComposeService):
+        cpus = self.cpu_packer.assign(service.service_name, service.cpu_request)
+        if not cpus:
+            print(f"Not pinning stage {service.service_name}: not enough free cores")
+            return
+
+        self._packed_stages[service.service_name] = (service.cpuset, service.environment)
+        service.cpuset = CpuPacker.format_cpuset(cpus)
+        service.environment = list(service.environment or []) + get_thread_environment(len(cpus))
+        print(f"Pinning stage {service.service_name} to cores {service.cpuset}")
+
+
+    def _unpin_stages(self):
+        for service in self.compose_client.services:
+            if service.service_name in self._packed_stages:
+                service.cpuset, service.environment = self._packed_stages.pop(service.service_name)
+                self.cpu_packer.release(service.service_name)
+
+
+    def _on_stage_exit(self, stage_name: str, return_code: int):
+        if self.tracer:
+            self.tracer.stage_exited(stage_name, return_code)
+        if self.cpu_packer:
+            self.cpu_packer.release(stage_name)
+
+        stage_key = self._pending_cache_records.pop(stage_name, None)
+        if stage_key and return_code == 0:
+            service = next(service for service in self.compose_client.services if service.service_name == stage_name)
+            self.stage_cache.record(stage_name, stage_key, service.outputs)
+
+        self._scheduler.notify_exit(stage_name, return_code)
+
+
+    def build_and_run_pipeline(self):
+        """
+        Pull and build the stage images and run the pipeline.
+
+        Stages are started as soon as the stages they depend on exit successfully, as reported by the backend's
+        container exit events. The logs of all stages are streamed concurrently to "<log_dir>/<stage_name>.log" 
+        and, if `console_logs` is set, to the console. Once all transient stages completed, the logs of the 
+        detached stages (e.g. serving) are followed until they stop. Persisted artifacts are exported by a last 
+        stage once all transient stages completed.
+        """
+        self.tracer = PipelineTracer() if self.trace_file else None
+
+        self._unpin_stages()
+        self._add_artifact_stages()
+        self.prepare_images()
+        self._bake_stage_images()
+        self.backend.prepare(self.compose_client.services, self.compose_client.volumes)
+
+        services = {service.service_name: service for service in self.compose_client.services}
+
+        self._scheduler = DAGScheduler(
+            dependencies=self.get_dependency_graph(),
+            start_stage=lambda stage_name: self._start_stage(services[stage_name]),
+            stop_stage=self.backend.stop_stage,
+            stage_costs={service.service_name: service.cpu_request or 0.0 for service in self.compose_client.services},
+            resource_budget=self.cpu_budget
+        )
+        self._pending_cache_records = {}
+        self.log_multiplexer = LogMultiplexer(log_dir=self.log_dir, console=self.console_logs)
+        self.backend.watch_exits(self._on_stage_exit)
+
+        try:
+            try:
+                self._scheduler.run()
+                self._scheduler.report()
+            finally:
+                self._stop_artifact_keeper()
+                if self.tracer:
+                    self._write_trace()
+
+            for service in self.compose_client.services:
+                if service.detach_on_build:
+                    self.log_multiplexer.wait(service.service_name)
+        finally:
+            self.log_multiplexer.close()
+            # Stops the exit watcher, the next run starts its own
+            self.backend.close()
+
+
+    def _write_trace(self):
+        self.tracer.close()
+        previous_phases = load_stage_phases(self.trace_file)
+        self.tracer.write_chrome_trace(self.trace_file)
+        print(self.tracer.summary(previous_phases))
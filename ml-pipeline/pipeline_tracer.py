@@ -0,0 +1,228 @@
+from typing import Dict, List, Optional, Tuple
+from contextlib import contextmanager
+import json
+import os
+import threading
+import time
+
+# Printed by the stage command once the requirements are installed, see get_command_and_entrypoint (only when tracing)
+REQUIREMENTS_INSTALLED_MARKER = "pipeline-requirements-installed"
+
+PIPELINE_TRACK = "pipeline"
+
+STAGE_PHASES = ["image pull", "container start", "dependency install", "user code", "log drain"]
+
+
+class PipelineTracer:
+    def __init__(self, sample_interval: float = 1.0):
+        """
+        PipelineTracer class to record where the time of a pipeline run goes.
+
+        Per stage it records the image pull, container create/start, dependency install (runtime `pip install`,
+        detected from a marker line in the stage logs), user code runtime, log drain and exit, plus CPU and memory
+        samples of the stage's container. Work shared by all stages (e.g. baking dependency images) is recorded on
+        a separate "pipeline" track. The result can be written as a Chrome trace-event file (open it in
+        chrome://tracing or https://ui.perfetto.dev) and summarized as a table.
+
+        Attributes:
+            sample_interval (float): Seconds between container CPU/memory samples.
+        """
+        self.sample_interval = sample_interval
+        self.start_time = time.time()
+        self.spans: List[Tuple[str, str, float, float, dict]] = []
+        self.instants: List[Tuple[str, str, float, dict]] = []
+        self.samples: List[Tuple[str, float, float, float]] = []
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self._samplers: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+
+
+    def add_span(self, name: str, track: str, start: float, end: float, **args):
+        with self._lock:
+            self.spans.append((name, track, start, end, args))
+
+
+    @contextmanager
+    def span(self, name: str, track: str = PIPELINE_TRACK, **args):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add_span(name, track, start, time.time(), **args)
+
+
+    def instant(self, name: str, track: str, **args):
+        with self._lock:
+            self.instants.append((name, track, time.time(), args))
+
+
+    def _mark(self, stage_name: str, event: str, timestamp: Optional[float] = None):
+        with self._lock:
+            self.stages.setdefault(stage_name, {})[event] = timestamp or time.time()
+
+
+    def stage_started(self, stage_name: str, stats_reader=None):
+        """
+        Mark the container of the stage as started and begin sampling its CPU and memory usage.
+
+        Args:
+            stage_name (str): The name of the stage.
+            stats_reader (Optional[Callable[[str], Optional[Tuple[float, int]]]]): Returns the CPU usage (percent
+                of one core) and memory usage (bytes) of the stage's container, or None if not available.
+        """
+        self._mark(stage_name, "started")
+        if stats_reader:
+            stopped = threading.Event()
+            self._samplers[stage_name] = stopped
+            threading.Thread(target=self._sample, args=(stage_name, stats_reader, stopped), name=f"stats-{stage_name}", daemon=True).start()
+
+
+    def _sample(self, stage_name: str, stats_reader, stopped: threading.Event):
+        while not stopped.wait(self.sample_interval):
+            try:
+                stats = stats_reader(stage_name)
+            except Exception:
+                stats = None
+            if stats is None:
+                continue
+            cpu_percent, memory_bytes = stats
+            with self._lock:
+                self.samples.append((stage_name, time.time(), cpu_percent, memory_bytes))
+
+
+    def log_line(self, stage_name: str, line: str):
+        if REQUIREMENTS_INSTALLED_MARKER in line and "requirements_installed" not in self.stages.get(stage_name, {}):
+            self._mark(stage_name, "requirements_installed")
+
+
+    def stage_exited(self, stage_name: str, return_code: int):
+        self._mark(stage_name, "exited")
+        self.instant("exit", stage_name, return_code=return_code)
+        if stage_name in self._samplers:
+            self._samplers.pop(stage_name).set()
+
+
+    def logs_drained(self, stage_name: str):
+        self._mark(stage_name, "logs_drained")
+
+
+    def close(self):
+        for stopped in self._samplers.values():
+            stopped.set()
+        self._samplers = {}
+
+
+    def get_stage_phases(self) -> Dict[str, Dict[str, float]]:
+        """
+        Get the duration in seconds of every phase of every stage.
+        """
+        phases: Dict[str, Dict[str, float]] = {}
+
+        with self._lock:
+            spans = self._stage_spans()
+
+        for name, track, start, end, _ in spans:
+            if track != PIPELINE_TRACK:
+                stage_phases = phases.setdefault(track, {})
+                stage_phases[name] = stage_phases.get(name, 0.0) + end - start
+
+        return phases
+
+
+    def _stage_spans(self) -> List[Tuple[str, str, float, float, dict]]:
+        spans = list(self.spans)
+        for stage_name, marks in self.stages.items():
+            started = marks.get("started")
+            installed = marks.get("requirements_installed")
+            exited = marks.get("exited")
+            if started and installed:
+                spans.append(("dependency install", stage_name, started, installed, {}))
+            if started and exited:
+                spans.append(("user code", stage_name, installed or started, exited, {}))
+            if exited and marks.get("logs_drained") and marks["logs_drained"] > exited:
+                spans.append(("log drain", stage_name, exited, marks["logs_drained"], {}))
+        return spans
+
+
+    def to_chrome_trace(self) -> dict:
+        with self._lock:
+            spans = self._stage_spans()
+            instants = list(self.instants)
+            samples = list(self.samples)
+
+        stage_tracks = {track for _, track, _, _, _ in spans} | {track for _, track, _, _ in instants}
+        tracks = [PIPELINE_TRACK] + sorted(stage_tracks - {PIPELINE_TRACK})
+        track_ids = {track: index for index, track in enumerate(tracks)}
+
+        def microseconds(timestamp: float) -> float:
+            return round((timestamp - self.start_time) * 1e6, 1)
+
+        events = [
+            {"name": "thread_name", "ph": "M", "pid": 1, "tid": track_ids[track], "args": {"name": track}}
+            for track in tracks
+        ]
+        for name, track, start, end, args in spans:
+            events.append({
+                "name": name, "cat": "stage" if track != PIPELINE_TRACK else "pipeline", "ph": "X",
+                "ts": microseconds(start), "dur": round((end - start) * 1e6, 1),
+                "pid": 1, "tid": track_ids[track], "args": args
+            })
+        for name, track, timestamp, args in instants:
+            events.append({"name": name, "ph": "i", "s": "t", "ts": microseconds(timestamp), "pid": 1, "tid": track_ids[track], "args": args})
+        for stage_name, timestamp, cpu_percent, memory_bytes in samples:
+            events.append({"name": f"{stage_name} cpu %", "ph": "C", "ts": microseconds(timestamp), "pid": 1, "args": {"cpu": cpu_percent}})
+            events.append({"name": f"{stage_name} memory MiB", "ph": "C", "ts": microseconds(timestamp), "pid": 1, "args": {"memory": memory_bytes / 2 ** 20}})
+
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {"start_time": self.start_time, "stage_phases": self.get_stage_phases()},
+        }
+
+
+    def write_chrome_trace(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.to_chrome_trace(), f)
+        print(f"Pipeline trace written to {path}")
+
+
+    def summary(self, previous_phases: Optional[Dict[str, Dict[str, float]]] = None) -> str:
+        """
+        Format the phase durations of every stage as a table, with the change from a previous run if given.
+        """
+        phases = self.get_stage_phases()
+        header = f"{'stage':<20}" + "".join(f"{phase:>20}" for phase in STAGE_PHASES)
+        rows = [header, "-" * len(header)]
+
+        for stage_name, stage_phases in phases.items():
+            row = f"{stage_name:<20}"
+            for phase in STAGE_PHASES:
+                if phase not in stage_phases:
+                    row += f"{'-':>20}"
+                    continue
+                cell = f"{stage_phases[phase]:.2f}s"
+                previous = (previous_phases or {}).get(stage_name, {}).get(phase)
+                if previous is not None:
+                    cell += f" ({stage_phases[phase] - previous:+.2f})"
+                row += f"{cell:>20}"
+            rows.append(row)
+
+        pipeline_spans = [(name, end - start) for name, track, start, end, _ in self.spans if track == PIPELINE_TRACK]
+        for name, duration in pipeline_spans:
+            rows.append(f"{PIPELINE_TRACK + ': ' + name:<40}{duration:.2f}s")
+
+        return "\n".join(rows)
+
+
+def load_stage_phases(trace_path: str) -> Optional[Dict[str, Dict[str, float]]]:
+    """
+    Load the stage phase durations from a trace written by a previous run, to compare runs.
+    """
+    try:
+        with open(trace_path) as f:
+            return json.load(f).get("otherData", {}).get("stage_phases")
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,80 @@
+from typing import Dict, List, Optional
+import math
+import os
+import threading
+
+THREAD_COUNT_ENVIRONMENT_VARIABLES = [
+    "OMP_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "TF_NUM_INTRAOP_THREADS",
+]
+
+
+def get_host_cpus() -> List[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def get_thread_environment(thread_count: int) -> List[str]:
+    """
+    Get the environment variables that size the thread pools of OpenMP, BLAS and TensorFlow to `thread_count`.
+
+    Without them every container sizes its pools for all host CPUs, even when it is limited to a few cores.
+    """
+    environment = [f"{variable}={thread_count}" for variable in THREAD_COUNT_ENVIRONMENT_VARIABLES]
+    environment.append(f"TF_NUM_INTEROP_THREADS={min(2, thread_count)}")
+    return environment
+
+
+class CpuPacker:
+    def __init__(self, cpus: Optional[List[int]] = None):
+        """
+        CpuPacker class to give concurrently running stages disjoint sets of host cores.
+
+        Cores are assigned first-fit from the lowest free core ID, so a stage's cores are contiguous whenever
+        possible, and returned to the pool when the stage exits.
+
+        Attributes:
+            cpus (Optional[List[int]]): The host cores to pack stages onto. Defaults to the cores this process may run on.
+        """
+        self.cpus = sorted(cpus) if cpus is not None else get_host_cpus()
+        self.assignments: Dict[str, List[int]] = {}
+        self._lock = threading.Lock()
+
+
+    def assign(self, stage_name: str, cpu_request: float) -> Optional[List[int]]:
+        """
+        Reserve ceil(cpu_request) free cores for the stage.
+
+        Returns:
+            Optional[List[int]]: The reserved core IDs, or None if not enough cores are free.
+        """
+        count = max(1, math.ceil(cpu_request))
+        with self._lock:
+            used = {cpu for cpus in self.assignments.values() for cpu in cpus}
+            free = [cpu for cpu in self.cpus if cpu not in used]
+            if len(free) < count:
+                return None
+
+            # Prefer the first run of consecutive free cores that is long enough
+            for start in range(len(free) - count + 1):
+                window = free[start:start + count]
+                if window[-1] - window[0] == count - 1:
+                    break
+            else:
+                window = free[:count]
+
+            self.assignments[stage_name] = window
+            return window
+
+
+    def release(self, stage_name: str):
+        with self._lock:
+            self.assignments.pop(stage_name, None)
+
+
+    @staticmethod
+    def format_cpuset(cpus: List[int]) -> str:
+        return ",".join(str(cpu) for cpu in cpus)
@@ -1,14 +1,16 @@
 import argparse
 import numpy as np
-from tensorflow.keras.datasets import cifar10
 import os
 
 TRAINING_DATA_FILE_NAME = 'training_data.npz'
+TRAINING_DATA_DIR_NAME = 'training_data'
 
-def main(args):
-    output_path = args.output_path
-    fraction = args.fraction
-    normalize_value = args.normalize_value
+STORAGE_FORMATS = ['npz_compressed', 'npz', 'npy_mmap']
+DTYPES = ['uint8', 'float32', 'float64']
+
+
+def load_cifar10(fraction):
+    from tensorflow.keras.datasets import cifar10
 
     # Load CIFAR-10 dataset
     (x_train, y_train), (x_test, y_test) = cifar10.load_data()
@@ -18,20 +20,77 @@ def main(args):
     num_test_samples = int(len(x_test) * fraction)
 
     # Slice the data arrays to load only the specified fraction
-    x_train = x_train[:num_train_samples]
-    y_train = y_train[:num_train_samples]
-    x_test = x_test[:num_test_samples]
-    y_test = y_test[:num_test_samples]
+    return x_train[:num_train_samples], y_train[:num_train_samples], x_test[:num_test_samples], y_test[:num_test_samples]
+
+
+def normalize_images(x, normalize_value, dtype='float64'):
+    """
+    Scale pixel values by `normalize_value` into `dtype`.
+
+    uint8 keeps the raw pixels, they are scaled when train.py loads them. float32 is computed in float32, so no
+    float64 copy of the images is made.
+    """
+    if dtype == 'uint8':
+        return x
+    if dtype == 'float32':
+        x = x.astype(np.float32)
+        x /= np.float32(normalize_value)
+        return x
+    return x / normalize_value
+
+
+def save_training_data(output_path, arrays, storage_format='npz_compressed', normalize_value=None):
+    """
+    Save the training data arrays in `output_path`.
+
+    npz_compressed and npz write a single training_data.npz file, with and without compression. npy_mmap writes
+    one .npy file per array to a training_data directory, which train.py memory-maps instead of reading.
+    `normalize_value` is stored with uint8 images, which train.py scales when loading.
+
+    Returns:
+        str: The path to pass to train.py as --input_path.
+    """
+    if storage_format not in STORAGE_FORMATS:
+        raise ValueError(f"Unknown storage format '{storage_format}', expected one of {STORAGE_FORMATS}")
+
+    if normalize_value is not None:
+        arrays = dict(arrays, normalize_value=np.asarray(normalize_value, dtype=np.float32))
+
+    if storage_format == 'npy_mmap':
+        save_path = os.path.join(output_path, TRAINING_DATA_DIR_NAME)
+        os.makedirs(save_path, exist_ok=True)
+        for name, array in arrays.items():
+            np.save(os.path.join(save_path, f"{name}.npy"), array)
+        return save_path
+
+    save_path = os.path.join(output_path, TRAINING_DATA_FILE_NAME)
+    if storage_format == 'npz_compressed':
+        np.savez_compressed(save_path, **arrays)
+    else:
+        np.savez(save_path, **arrays)
+    return save_path
+
+
+def main(args):
+    output_path = args.output_path
+    fraction = args.fraction
+    normalize_value = args.normalize_value
+
+    x_train, y_train, x_test, y_test = load_cifar10(fraction)
 
     print("Done loading data")
 
     # Normalize pixel values to be between 0 and 1
-    x_train = x_train / normalize_value
-    x_test = x_test / normalize_value
+    x_train = normalize_images(x_train, normalize_value, args.dtype)
+    x_test = normalize_images(x_test, normalize_value, args.dtype)
 
-    # Save the data as .npz file
-    save_path = os.path.join(output_path, TRAINING_DATA_FILE_NAME)
-    np.savez_compressed(save_path, x_train=x_train, y_train=y_train, x_test=x_test, y_test=y_test)
+    # Save the data as .npz file or one .npy file per array
+    save_path = save_training_data(
+        output_path,
+        {'x_train': x_train, 'y_train': y_train, 'x_test': x_test, 'y_test': y_test},
+        storage_format=args.storage_format,
+        normalize_value=normalize_value if args.dtype == 'uint8' else None
+    )
     print(f"Data saved to {save_path}")
 
 if __name__ == '__main__':
@@ -53,8 +112,22 @@ if __name__ == '__main__':
         default=255.0,
         help='Value to normalize pixel values by'
     )
+    parser.add_argument(
+        '--storage_format',
+        type=str,
+        choices=STORAGE_FORMATS,
+        default='npz_compressed',
+        help='How to store the data: one compressed .npz, one uncompressed .npz, or one memory-mappable .npy per array'
+    )
+    parser.add_argument(
+        '--dtype',
+        type=str,
+        choices=DTYPES,
+        default='float64',
+        help='Type of the stored images, uint8 stores the raw pixels and defers normalizing to training'
+    )
     args = parser.parse_args()
 
     print('Data preprocessing started...')
     main(args)
-    print('Data preprocessing complete.')
\ No newline at end of file
+    print('Data preprocessing complete.')
@@ -0,0 +1,415 @@
+"""
+Load test the serving stage's /predict endpoint and report throughput and latency percentiles.
+
+Requests upload CIFAR-shaped (32x32 RGB) PNG images like real clients do. Two load models are supported:
+    closed   `concurrency` clients each send their next request as soon as the previous one returned, which
+             measures the maximum throughput at that concurrency.
+    open     requests arrive at a fixed `rate` (evenly spaced or Poisson) whether or not earlier requests
+             returned, and are sent by up to `concurrency` connections. Latency is measured from the time a
+             request was due, so queueing behind a slow server counts towards it.
+
+With --stub a stand-in server with a tiny model is started in-process instead, so the harness runs without the
+training output or TensorFlow. The stub shares the GIL with the clients, so its numbers are only comparable to
+other stub runs. Only the Python standard library is used.
+
+Usage:
+    python serving/load_test.py --url http://localhost:5000/predict --mode closed --concurrency 8 --duration 30
+    python serving/load_test.py --stub --mode open --rate 200 --output_path load_test.json
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+import http.client
+import argparse
+import platform
+import threading
+import random
+import struct
+import json
+import math
+import time
+import zlib
+import os
+
+IMAGE_SIZE = 32
+NUM_CLASSES = 10
+PERCENTILES = [50, 95, 99, 99.9]
+
+
+def encode_png(pixels, width=IMAGE_SIZE, height=IMAGE_SIZE):
+    """
+    Encode 8-bit RGB `pixels` (bytes, row by row) as a PNG without filtering.
+    """
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff)
+
+    row_size = width * 3
+    rows = b"".join(b"\x00" + pixels[y * row_size:(y + 1) * row_size] for y in range(height))
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(rows)) + chunk(b"IEND", b"")
+
+
+def decode_png(data):
+    """
+    Decode a PNG written by `encode_png` into its RGB pixels, raises ValueError for other PNGs.
+    """
+    if not data.startswith(b"\x89PNG\r\n\x1a\n"):
+        raise ValueError("Not a PNG file")
+
+    offset, idat, width, height = 8, b"", 0, 0
+    while offset < len(data):
+        length, tag = struct.unpack(">I4s", data[offset:offset + 8])
+        body = data[offset + 8:offset + 8 + length]
+        if tag == b"IHDR":
+            width, height, bit_depth, color_type = struct.unpack(">IIBB", body[:10])
+            if (bit_depth, color_type) != (8, 2):
+                raise ValueError("Only 8-bit RGB PNG files are supported")
+        elif tag == b"IDAT":
+            idat += body
+        offset += length + 12
+
+    rows = zlib.decompress(idat)
+    row_size = width * 3 + 1
+    if len(rows) != row_size * height or any(rows[y * row_size] != 0 for y in range(height)):
+        raise ValueError("Only unfiltered PNG files are supported")
+    return b"".join(rows[y * row_size + 1:(y + 1) * row_size] for y in range(height))
+
+
+def generate_images(count, seed=42):
+    rng = random.Random(seed)
+    return [encode_png(bytes(rng.getrandbits(8) for _ in range(IMAGE_SIZE * IMAGE_SIZE * 3))) for _ in range(count)]
+
+
+def encode_multipart(file_data, field_name="file", file_name="image.png"):
+    boundary = f"load-test-{random.getrandbits(64):016x}"
+    body = (
+        f"--{boundary}\r\n"
+        f"Content-Disposition: form-data; name=\"{field_name}\"; filename=\"{file_name}\"\r\n"
+        f"Content-Type: image/png\r\n\r\n"
+    ).encode() + file_data + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def parse_multipart_file(body, content_type, field_name="file"):
+    boundary = content_type.split("boundary=", 1)[-1].strip('"').encode()
+    for part in body.split(b"--" + boundary):
+        headers, _, content = part.partition(b"\r\n\r\n")
+        if f"name=\"{field_name}\"".encode() in headers:
+            return content[:-2] if content.endswith(b"\r\n") else content
+    raise ValueError(f"No '{field_name}' field in the request")
+
+
+class StubModel:
+    def __init__(self, seed=42):
+        """
+        StubModel class standing in for the trained CNN: a linear layer over the mean color of the image.
+
+        Attributes:
+            weights (List[List[float]]): The weight of each color channel for each class.
+        """
+        rng = random.Random(seed)
+        self.weights = [[rng.uniform(-1, 1) for _ in range(3)] for _ in range(NUM_CLASSES)]
+
+
+    def predict_class(self, pixels):
+        means = [sum(pixels[channel::3]) / (len(pixels) / 3) / 255.0 for channel in range(3)]
+        scores = [sum(weight * mean for weight, mean in zip(weights, means)) for weights in self.weights]
+        return scores.index(max(scores))
+
+
+def start_stub_server(port=0, delay_ms=0.0):
+    """
+    Start a threaded HTTP server answering /health and /predict like serving/serve.py, with a StubModel and an
+    optional fixed delay per prediction to emulate inference time.
+
+    Returns:
+        ThreadingHTTPServer: The running server, its port is `server.server_address[1]`.
+    """
+    model = StubModel()
+
+    class StubHandler(BaseHTTPRequestHandler):
+        # Keep-alive, so clients reuse their connection like they would with a production server. Headers and
+        # body are written separately, without TCP_NODELAY every response would wait for a delayed ACK
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def _reply(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._reply(200, {"status": "ok", "replica": "stub"})
+            else:
+                self._reply(404, {"error": "Not found"})
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if self.path != "/predict":
+                self._reply(404, {"error": "Not found"})
+                return
+
+            try:
+                pixels = decode_png(parse_multipart_file(body, self.headers.get("Content-Type", "")))
+            except (ValueError, zlib.error, struct.error) as e:
+                self._reply(400, {"error": str(e)})
+                return
+
+            if delay_ms:
+                time.sleep(delay_ms / 1000)
+            self._reply(200, {"predicted_class": model.predict_class(pixels)})
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class LoadTestClient:
+    def __init__(self, url, images, timeout):
+        """
+        LoadTestClient class sending /predict requests over one keep-alive connection.
+
+        Attributes:
+            url (str): The URL of the prediction endpoint.
+            images (List[bytes]): The PNG images to upload, cycled through.
+            timeout (float): Seconds to wait for a response.
+        """
+        self.url = urlsplit(url)
+        self.images = images
+        self.timeout = timeout
+        self.connection = None
+        self.requests = 0
+
+
+    def _connect(self):
+        connection_class = http.client.HTTPSConnection if self.url.scheme == "https" else http.client.HTTPConnection
+        return connection_class(self.url.hostname, self.url.port, timeout=self.timeout)
+
+
+    def send(self):
+        """
+        Send one prediction request.
+
+        Returns:
+            Optional[str]: None if the request succeeded, otherwise a short description of the error.
+        """
+        body, content_type = encode_multipart(self.images[self.requests % len(self.images)])
+        self.requests += 1
+        try:
+            if self.connection is None:
+                self.connection = self._connect()
+            self.connection.request("POST", self.url.path or "/", body=body, headers={"Content-Type": content_type})
+            response = self.connection.getresponse()
+            response.read()
+            if response.getheader("Connection", "").lower() == "close":
+                self.close()
+            return None if response.status == 200 else f"HTTP {response.status}"
+        except (OSError, http.client.HTTPException) as e:
+            # The connection is in an unknown state, the next request opens a new one
+            self.close()
+            return type(e).__name__
+
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+def percentile(sorted_values, percent):
+    # Nearest-rank percentile, so p99.9 of fewer than 1000 requests is the slowest request
+    if not sorted_values:
+        return None
+    rank = math.ceil(percent / 100 * len(sorted_values))
+    return sorted_values[min(len(sorted_values), max(rank, 1)) - 1]
+
+
+def run_closed_loop(url, images, concurrency, duration, max_requests, timeout):
+    records = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+    sent = [0]
+
+    def worker(worker_index):
+        client = LoadTestClient(url, images[worker_index % len(images):] + images[:worker_index % len(images)], timeout)
+        while time.perf_counter() < deadline:
+            with lock:
+                if max_requests and sent[0] >= max_requests:
+                    break
+                sent[0] += 1
+            start = time.perf_counter()
+            error = client.send()
+            end = time.perf_counter()
+            with lock:
+                records.append((start, end - start, error))
+        client.close()
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return records
+
+
+def get_arrival_times(rate, duration, max_requests, arrival, seed=42):
+    rng = random.Random(seed)
+    times, current = [], 0.0
+    while current < duration and not (max_requests and len(times) >= max_requests):
+        times.append(current)
+        current += rng.expovariate(rate) if arrival == "poisson" else 1.0 / rate
+    return times
+
+
+def run_open_loop(url, images, concurrency, rate, duration, max_requests, timeout, arrival):
+    records = []
+    lock = threading.Lock()
+    arrival_times = get_arrival_times(rate, duration, max_requests, arrival)
+    next_request = [0]
+    start_time = time.perf_counter() + 0.1
+
+    def worker(worker_index):
+        client = LoadTestClient(url, images[worker_index % len(images):] + images[:worker_index % len(images)], timeout)
+        while True:
+            with lock:
+                if next_request[0] >= len(arrival_times):
+                    break
+                due = start_time + arrival_times[next_request[0]]
+                next_request[0] += 1
+
+            wait = due - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            error = client.send()
+            # Measured from the time the request was due, not from when a connection became free
+            end = time.perf_counter()
+            with lock:
+                records.append((due, end - due, error))
+        client.close()
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return records
+
+
+def summarize(records, warmup):
+    """
+    Summarize the (start time, latency, error) records, leaving out requests started in the first `warmup`
+    seconds.
+    """
+    if not records:
+        return {"requests": 0, "errors": 0, "throughput": 0.0, "latency_ms": {}}
+
+    first_start = min(start for start, _, _ in records)
+    measured = [record for record in records if record[0] >= first_start + warmup]
+    if not measured:
+        raise ValueError(f"No requests were started after the {warmup}s warmup, increase the duration")
+
+    latencies = sorted(latency for _, latency, error in measured if error is None)
+    errors = {}
+    for _, _, error in measured:
+        if error is not None:
+            errors[error] = errors.get(error, 0) + 1
+
+    elapsed = max(start + latency for start, latency, _ in measured) - min(start for start, _, _ in measured)
+    latency_ms = {f"p{percent:g}": percentile(latencies, percent) * 1000 for percent in PERCENTILES} if latencies else {}
+    if latencies:
+        latency_ms.update(mean=sum(latencies) / len(latencies) * 1000, max=latencies[-1] * 1000)
+
+    return {
+        "requests": len(measured),
+        "errors": sum(errors.values()),
+        "error_types": errors,
+        "elapsed_s": elapsed,
+        "throughput": len(latencies) / elapsed if elapsed > 0 else 0.0,
+        "latency_ms": latency_ms,
+    }
+
+
+def print_summary(summary):
+    print(f"Requests: {summary['requests']}, errors: {summary['errors']} {summary.get('error_types') or ''}")
+    print(f"Throughput: {summary['throughput']:.1f} requests/s")
+    if summary["latency_ms"]:
+        print("Latency (ms): " + ", ".join(f"{name} {value:.2f}" for name, value in summary["latency_ms"].items()))
+
+
+def main(args):
+    if args.mode == "open" and not args.rate:
+        raise ValueError("--rate is required in open-loop mode")
+
+    server = None
+    url = args.url
+    if args.stub:
+        server = start_stub_server(delay_ms=args.stub_delay_ms)
+        url = f"http://127.0.0.1:{server.server_address[1]}/predict"
+        print(f"Started a stub server on {url}")
+
+    images = generate_images(args.images, args.seed)
+    print(f"Load testing {url} {args.mode}-loop for {args.duration}s with concurrency {args.concurrency}")
+
+    try:
+        if args.mode == "closed":
+            records = run_closed_loop(url, images, args.concurrency, args.duration, args.requests, args.timeout)
+        else:
+            records = run_open_loop(url, images, args.concurrency, args.rate, args.duration, args.requests, args.timeout, args.arrival)
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    summary = summarize(records, args.warmup)
+    print_summary(summary)
+
+    if args.output_path:
+        results = {
+            "label": args.label,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "host": platform.node(),
+            "config": {
+                "url": url,
+                "mode": args.mode,
+                "concurrency": args.concurrency,
+                "rate": args.rate if args.mode == "open" else None,
+                "arrival": args.arrival if args.mode == "open" else None,
+                "duration_s": args.duration,
+                "warmup_s": args.warmup,
+                "stub": args.stub,
+                "stub_delay_ms": args.stub_delay_ms if args.stub else None,
+            },
+            "results": summary,
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(args.output_path)), exist_ok=True)
+        with open(args.output_path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to {args.output_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Load test the /predict endpoint of the serving stage.')
+    parser.add_argument('--url', type=str, default='http://localhost:5000/predict', help='URL of the prediction endpoint.')
+    parser.add_argument('--mode', type=str, choices=['closed', 'open'], default='closed', help='Closed-loop (fixed concurrency) or open-loop (fixed arrival rate) load.')
+    parser.add_argument('--concurrency', type=int, default=8, help='Number of concurrent connections.')
+    parser.add_argument('--rate', type=float, default=None, help='Requests per second in open-loop mode.')
+    parser.add_argument('--arrival', type=str, choices=['uniform', 'poisson'], default='poisson', help='Spacing of the requests in open-loop mode.')
+    parser.add_argument('--duration', type=float, default=30.0, help='Seconds to send requests for.')
+    parser.add_argument('--requests', type=int, default=None, help='Stop after this many requests.')
+    parser.add_argument('--warmup', type=float, default=2.0, help='Seconds at the start left out of the results.')
+    parser.add_argument('--timeout', type=float, default=30.0, help='Seconds to wait for each response.')
+    parser.add_argument('--images', type=int, default=16, help='Number of distinct random images to upload.')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed of the images.')
+    parser.add_argument('--stub', action='store_true', help='Test a stand-in server with a tiny model instead of --url.')
+    parser.add_argument('--stub_delay_ms', type=float, default=0.0, help='Inference time emulated by the stub server.')
+    parser.add_argument('--label', type=str, default=None, help='Label stored with the results, e.g. the serving mode or backend.')
+    parser.add_argument('--output_path', type=str, default=None, help='Path to write the results to as JSON.')
+
+    args = parser.parse_args()
+    main(args)
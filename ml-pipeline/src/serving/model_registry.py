@@ -0,0 +1,150 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+MODEL_EXTENSIONS = (".h5", ".keras")
+
+
+def get_path_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+
+    size = 0
+    for root, _, file_names in os.walk(path):
+        for file_name in file_names:
+            size += os.path.getsize(os.path.join(root, file_name))
+    return size
+
+
+class ModelRegistry:
+    def __init__(self, model_dir, loader, memory_budget_bytes=None):
+        """
+        ModelRegistry class to serve several models from one process, by name.
+
+        Every model in `model_dir` (a .h5/.keras file or a SavedModel directory, named after the file without
+        its extension) is loaded on its first request. Requests for a model that is being loaded wait for that
+        load instead of loading it again. When the loaded models exceed the memory budget, the least recently
+        used ones are evicted and loaded again on their next request. A model's size is estimated by its size
+        on disk.
+
+        Attributes:
+            model_dir (str): The directory containing the models.
+            loader (Callable[[str], Any]): Loads a model from its path.
+            memory_budget_bytes (int): The total size of the models kept loaded. Defaults to no limit.
+        """
+        self.model_dir = model_dir
+        self.loader = loader
+        self.memory_budget_bytes = memory_budget_bytes
+        self._models = OrderedDict()
+        self._loading = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+
+    def available_models(self):
+        models = {}
+        for entry in sorted(os.listdir(self.model_dir)):
+            path = os.path.join(self.model_dir, entry)
+            name, extension = os.path.splitext(entry)
+            if os.path.isfile(path) and extension in MODEL_EXTENSIONS:
+                models[name] = path
+            elif os.path.isdir(path) and os.path.exists(os.path.join(path, "saved_model.pb")):
+                models[entry] = path
+        return models
+
+
+    def _get_stats(self, name):
+        return self._stats.setdefault(name, {"loads": 0, "hits": 0, "evictions": 0, "load_time": None, "size_bytes": None})
+
+
+    def get(self, name):
+        """
+        Get a model by name, loading it if needed.
+
+        Raises:
+            KeyError: If there is no model with this name in the model directory.
+        """
+        with self._lock:
+            if name in self._models:
+                self._models.move_to_end(name)
+                self._get_stats(name)["hits"] += 1
+                return self._models[name][0]
+
+            future = self._loading.get(name)
+            is_loader = future is None
+            if is_loader:
+                future = Future()
+                self._loading[name] = future
+
+        if not is_loader:
+            # Another request is loading the model already
+            model = future.result()
+            with self._lock:
+                self._get_stats(name)["hits"] += 1
+            return model
+
+        try:
+            model, size = self._load(name)
+        except BaseException as e:
+            with self._lock:
+                del self._loading[name]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            self._models[name] = (model, size)
+            del self._loading[name]
+            self._evict(keep=name)
+        future.set_result(model)
+        return model
+
+
+    def _load(self, name):
+        path = self.available_models().get(name)
+        if path is None:
+            raise KeyError(name)
+
+        print(f"Loading model {name} from {path}")
+        start_time = time.time()
+        model = self.loader(path)
+        load_time = time.time() - start_time
+        size = get_path_size(path)
+        print(f"Loaded model {name} in {load_time:.2f}s")
+
+        with self._lock:
+            stats = self._get_stats(name)
+            stats["loads"] += 1
+            stats["load_time"] = load_time
+            stats["size_bytes"] = size
+        return model, size
+
+
+    def _evict(self, keep):
+        if self.memory_budget_bytes is None:
+            return
+
+        loaded_size = sum(size for _, size in self._models.values())
+        for name in list(self._models):
+            if loaded_size <= self.memory_budget_bytes:
+                break
+            if name == keep:
+                continue
+            _, size = self._models.pop(name)
+            loaded_size -= size
+            self._get_stats(name)["evictions"] += 1
+            print(f"Evicted model {name}")
+
+
+    def stats(self):
+        """
+        Get the load time, size, number of loads, hits and evictions of every available model and whether it
+        is loaded.
+        """
+        available_models = self.available_models()
+        with self._lock:
+            return {
+                name: dict(self._get_stats(name), loaded=name in self._models)
+                for name in available_models
+            }
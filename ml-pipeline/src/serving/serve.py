@@ -1,4 +1,5 @@
 import os
+import socket
 import joblib
 import argparse
 import numpy as np
@@ -8,40 +9,88 @@ from tensorflow.keras.models import load_model
 from tensorflow.keras.preprocessing import image
 from flask import Flask, request, jsonify
 
+from model_registry import ModelRegistry
+
 app = Flask(__name__)
 
+model = None
+registry = None
+
 def load_trained_model(model_path):
     return load_model(model_path)
 
 
-@app.route('/predict', methods=['POST'])
-def predict():
-    img_file = request.files['file']
-    
+@app.route('/health', methods=['GET'])
+def health():
+    # Used by the load balancer to only route requests to replicas that have loaded the model
+    if model is None and registry is None:
+        return jsonify({'status': 'loading', 'replica': socket.gethostname()}), 503
+    return jsonify({'status': 'ok', 'replica': socket.gethostname()})
+
+
+def load_image_array(img_file):
     # Load the image and preprocess it
     img = image.load_img(img_file, target_size=(32, 32))
     img_array = image.img_to_array(img)
     img_array = np.expand_dims(img_array, axis=0)
-    img_array = img_array.astype('float32') / 255.0
+    return img_array.astype('float32') / 255.0
+
 
+def predict_class(predict_model, img_file):
     # Make a prediction
-    predictions = model.predict(img_array)
+    predictions = predict_model.predict(load_image_array(img_file))
     predicted_class = np.argmax(predictions, axis=1)
+    return int(predicted_class[0])
+
+
+@app.route('/predict', methods=['POST'])
+def predict():
+    if model is None:
+        return jsonify({'error': 'No default model loaded, use /models/<name>/predict'}), 404
 
     # Return the prediction as a JSON response
-    return jsonify({'predicted_class': int(predicted_class[0])})
+    return jsonify({'predicted_class': predict_class(model, request.files['file'])})
+
+
+@app.route('/models', methods=['GET'])
+def list_models():
+    if registry is None:
+        return jsonify({'error': 'No model directory configured'}), 404
+    return jsonify(registry.stats())
+
+
+@app.route('/models/<name>/predict', methods=['POST'])
+def predict_with_model(name):
+    if registry is None:
+        return jsonify({'error': 'No model directory configured'}), 404
+
+    try:
+        named_model = registry.get(name)
+    except KeyError:
+        return jsonify({'error': f'Unknown model: {name}'}), 404
+
+    return jsonify({'model': name, 'predicted_class': predict_class(named_model, request.files['file'])})
 
 
 if __name__ == '__main__':
     print("Starting server...")
     parser = argparse.ArgumentParser(description='Serve the trained model.')
-    parser.add_argument('--model_path', type=str, default=os.path.join(os.getcwd(), "cnn_mode.h5"), help='Path to the trained model.')
+    parser.add_argument('--model_path', type=str, default=None, help='Path to the model served on /predict. Defaults to cnn_mode.h5 in the working directory unless --model_dir is set.')
+    parser.add_argument('--model_dir', type=str, default=None, help='Directory of models served by name on /models/<name>/predict, loaded on first use.')
+    parser.add_argument('--memory_budget_mb', type=int, default=None, help='Total size of the models kept loaded from --model_dir, least recently used models are evicted beyond it.')
     parser.add_argument('--port', type=int, default=5000, help='Port to run the server on.')
     
     args = parser.parse_args()
 
-    print(f"Loading model from {args.model_path}")
-    model = load_trained_model(args.model_path)
+    if args.model_dir:
+        memory_budget_bytes = args.memory_budget_mb * 1024 * 1024 if args.memory_budget_mb else None
+        registry = ModelRegistry(args.model_dir, loader=load_trained_model, memory_budget_bytes=memory_budget_bytes)
+        print(f"Serving models from {args.model_dir}: {', '.join(registry.available_models())}")
+
+    model_path = args.model_path or (None if args.model_dir else os.path.join(os.getcwd(), "cnn_mode.h5"))
+    if model_path:
+        print(f"Loading model from {model_path}")
+        model = load_trained_model(model_path)
 
     app.run(host='0.0.0.0', port=args.port)
     print(f"Server running on port {args.port}")
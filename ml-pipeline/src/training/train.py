@@ -2,20 +2,50 @@ import os
 import argparse
 import numpy as np
 
-import tensorflow as tf
-from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import Conv2D, MaxPooling2D, Flatten, Dense
-from tensorflow.keras.utils import to_categorical
+DATA_KEYS = ['x_train', 'y_train', 'x_test', 'y_test']
+
+
+def load_training_data(input_path):
+    """
+    Load the arrays saved by preprocessing/process.py, from an .npz file or a directory of .npy files.
+
+    .npy files are memory-mapped, so float images are paged in from the file as they are read, model.fit still copies
+    them into a tensor. uint8 images are scaled by their stored normalize value into float32.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]: x_train, y_train, x_test and y_test.
+    """
+    if os.path.isdir(input_path):
+        def read(name):
+            return np.load(os.path.join(input_path, f"{name}.npy"), mmap_mode='r')
+        has_normalize_value = os.path.exists(os.path.join(input_path, "normalize_value.npy"))
+    else:
+        data = np.load(input_path)
+        read = data.__getitem__
+        has_normalize_value = 'normalize_value' in data.files
+
+    x_train, y_train, x_test, y_test = (read(key) for key in DATA_KEYS)
+
+    if x_train.dtype == np.uint8:
+        if not has_normalize_value:
+            raise ValueError(f"uint8 images in {input_path} are missing their normalize value")
+        normalize_value = np.float32(read('normalize_value'))
+        x_train = x_train.astype(np.float32)
+        x_train /= normalize_value
+        x_test = x_test.astype(np.float32)
+        x_test /= normalize_value
+
+    return x_train, y_train, x_test, y_test
+
 
 def main(args):
-    
+    from tensorflow.keras.models import Sequential
+    from tensorflow.keras.layers import Conv2D, MaxPooling2D, Flatten, Dense
+    from tensorflow.keras.utils import to_categorical
+
     # Load preprocessed data
     try:
-        data = np.load(args.input_path)
-        x_train = data['x_train']
-        y_train = data['y_train']
-        x_test = data['x_test']
-        y_test = data['y_test']
+        x_train, y_train, x_test, y_test = load_training_data(args.input_path)
         print(f"Loaded data from {args.input_path}")
     except FileNotFoundError:
         print(f"File not found: {args.input_path}")
@@ -56,10 +86,10 @@ def main(args):
 if __name__ == "__main__":
     print("Starting training script...")
     parser = argparse.ArgumentParser(description='Train a Sequential model on the dataset.')
-    parser.add_argument('--input_path', type=str, required=True, help='Path to the dataset NPZ file.')
+    parser.add_argument('--input_path', type=str, required=True, help='Path to the dataset NPZ file, or the directory of .npy files.')
     parser.add_argument('--output_path', type=str, default=os.path.join(os.getcwd(), "cnn_model.h5"), help='Output file path.')
     parser.add_argument('--epochs', type=int, default=10, help='Number of epochs.')
     parser.add_argument('--batch_size', type=int, default=64, help='Batch size.')
 
     args = parser.parse_args()
-    main(args)
\ No newline at end of file
+    main(args)
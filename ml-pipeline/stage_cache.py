@@ -0,0 +1,153 @@
+from typing import Dict, List, Optional, Tuple, Union
+import hashlib
+import json
+import os
+
+STAGE_CACHE_DIR_NAME = ".pipeline_cache"
+
+IGNORED_NAMES = {"__pycache__", ".git", ".ipynb_checkpoints", ".DS_Store"}
+
+
+def list_files(path: str) -> List[Tuple[str, str]]:
+    """
+    List the (relative path, path) of the files in a directory in sorted order, skipping caches and VCS metadata.
+    """
+    files = []
+    for root, dirs, file_names in os.walk(path):
+        dirs[:] = sorted(d for d in dirs if d not in IGNORED_NAMES)
+        for file_name in sorted(file_names):
+            if file_name in IGNORED_NAMES or file_name.endswith(".pyc"):
+                continue
+            file_path = os.path.join(root, file_name)
+            files.append((os.path.relpath(file_path, path), file_path))
+    return files
+
+
+def hash_path(path: str) -> str:
+    """
+    Hash the content of a file or, recursively, of a directory.
+
+    Directory entries are hashed in sorted order together with their relative paths, so renaming a file
+    changes the hash while touching it without changing its content does not.
+    """
+    digest = hashlib.sha256()
+
+    if not os.path.exists(path):
+        digest.update(b"missing")
+        return digest.hexdigest()
+
+    files = [(os.path.basename(path), path)] if os.path.isfile(path) else list_files(path)
+
+    for relative_path, file_path in files:
+        digest.update(relative_path.encode() + b"\0")
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        digest.update(b"\0")
+
+    return digest.hexdigest()
+
+
+def get_output_fingerprint(path: str) -> Optional[List[Union[float, str]]]:
+    """
+    Get the size and modification time of an output file or, for a directory, a hash of the relative path, size
+    and modification time of every file in it, so rewriting a file inside an output directory is detected.
+    """
+    if not os.path.exists(path):
+        return None
+    if os.path.isfile(path):
+        stat = os.stat(path)
+        return [stat.st_size, stat.st_mtime]
+
+    digest = hashlib.sha256()
+    for relative_path, file_path in list_files(path):
+        stat = os.stat(file_path)
+        digest.update(f"{relative_path}\0{stat.st_size}\0{stat.st_mtime_ns}\0".encode())
+    return [digest.hexdigest()]
+
+
+class StageCache:
+    def __init__(self, cache_dir: str = STAGE_CACHE_DIR_NAME):
+        """
+        StageCache class to skip pipeline stages whose inputs have not changed since their last successful run.
+
+        Every stage gets a key hashed from its image digest, entrypoint, command, environment, volumes, the content
+        of its declared inputs (including its source code directory) and the keys of the stages it depends on,
+        so a change only invalidates the stage itself and the stages downstream of it. The key and the size and
+        modification time of the declared outputs (of every file, for output directories) are recorded in a
+        manifest per stage after a successful run.
+
+        Attributes:
+            cache_dir (str): The directory to store the stage manifests in.
+        """
+        self.cache_dir = cache_dir
+
+
+    def get_stage_key(
+            self,
+            image_id: str,
+            entrypoint: Optional[str],
+            command: Optional[str],
+            environment: Optional[List[str]],
+            volumes: Optional[List[str]],
+            inputs: Optional[List[str]],
+            upstream_keys: Optional[List[str]]
+    ) -> str:
+        key = {
+            "image_id": image_id,
+            "entrypoint": entrypoint,
+            "command": command,
+            "environment": sorted(environment or []),
+            "volumes": sorted(volumes or []),
+            "inputs": {path: hash_path(path) for path in sorted(inputs or [])},
+            "upstream_keys": sorted(upstream_keys or []),
+        }
+        return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+    def _manifest_path(self, stage_name: str) -> str:
+        return os.path.join(self.cache_dir, f"{stage_name}.json")
+
+
+    def is_cached(self, stage_name: str, key: str, outputs: List[str]) -> bool:
+        """
+        Check whether the stage already ran with this key and its outputs are still the ones it produced.
+        """
+        if not outputs:
+            return False
+
+        try:
+            with open(self._manifest_path(stage_name)) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        if manifest.get("key") != key:
+            return False
+
+        recorded_outputs: Dict[str, List[float]] = manifest.get("outputs", {})
+        return all(
+            path in recorded_outputs and get_output_fingerprint(path) == recorded_outputs[path]
+            for path in outputs
+        )
+
+
+    def record(self, stage_name: str, key: str, outputs: List[str]):
+        """
+        Record a successful run of the stage, if all of its declared outputs exist.
+        """
+        fingerprints = {path: get_output_fingerprint(path) for path in outputs}
+        if not outputs or any(fingerprint is None for fingerprint in fingerprints.values()):
+            print(f"Not caching stage {stage_name}: declared outputs are missing")
+            return
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(self._manifest_path(stage_name), "w") as f:
+            json.dump({"key": key, "outputs": fingerprints}, f, indent=2)
+
+
+    def invalidate(self, stage_name: str):
+        try:
+            os.remove(self._manifest_path(stage_name))
+        except FileNotFoundError:
+            pass